@@ -1,15 +1,21 @@
 import requests
-from flask import request
+from requests.adapters import HTTPAdapter
 
 headers = {"Authorization": "Bearer {YOUR_ACCESS_TOKEN}"}
+timeout = (10, 60) # Seconds to connect and to wait for the response
+
+# One pooled session is shared by every request, so the connection to GitHub is kept alive between queries
+session = requests.Session()
+session.headers.update({"Accept-Encoding": "gzip"})
+session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=10))
 
 class MyQuery():
-  def run_query(self, query): # A simple function to use requests.post to make the API call. Note the json= section.
-      response = requests.post('https://api.github.com/graphql', json={'query': query}, headers=headers)
+  def run_query(self, query): # A simple function to use the shared session to make the API call. Note the json= section.
+      response = session.post('https://api.github.com/graphql', json={'query': query}, headers=headers, timeout=timeout)
       if response.status_code == 200:
           return response
       else:
-          raise Exception("Query failed to run by returning code of {}. {}".format(request.status_code, query))
+          raise Exception("Query failed to run by returning code of {}. {}".format(response.status_code, query))
 
 
   def pg_query(self, owner, name, whole_name, year):
@@ -8,3 +8,5 @@ FILENAMES = [
 CSV = 'service/ml_models/combined_data.csv'
 
 WORD_SET = 'service/vectorization/most_common_words.csv'
+
+NLTK_DATA = 'nltk_data'
@@ -1,12 +1,9 @@
 import pandas as pd
 from service.vectorization.comment_vectorizator import CommentVectorizator
 import pickle
-import nltk
 
 
 def predict_by_loading(df, filenames):
-    nltk.downloader.download('vader_lexicon')
-    nltk.download('stopwords')
     # To load models use following:
     predictions = []
     data = CommentVectorizator().vectorize(df)
@@ -8,11 +8,27 @@ import re
 import service.constants as cs
 
 
+# Resources found locally are never downloaded again
+NLTK_RESOURCES = {
+    'sentiment/vader_lexicon.zip': 'vader_lexicon',
+    'corpora/stopwords': 'stopwords'
+}
+
+
+def load_nltk_resources():
+    if cs.NLTK_DATA not in nltk.data.path:
+        nltk.data.path.insert(0, cs.NLTK_DATA)
+    for resource, package in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            nltk.download(package, download_dir=cs.NLTK_DATA)
+
+
 class NLP:
 
     def __init__(self):
-        # nltk.download('stopwords')
-        # nltk.download('vader_lexicon')
+        load_nltk_resources()
         self.sia = SentimentIntensityAnalyzer()
         self.stop_words = set(stopwords.words('english'))
         self.stemmer = PorterStemmer()
@@ -2,6 +2,7 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import numpy as np
+import tensorflow as tf
 from sklearn.metrics import precision_recall_fscore_support
 from tensorflow import keras
 from tf_explain.core.smoothgrad import SmoothGrad
@@ -47,11 +48,14 @@ class BaseCNN:
         self.dimension2 = True
         self.model_ready = True
 
-    def trainModel(self, obs, res, val_split=0.3, val_set=None, epochs=10, batch_size=32):
+    def trainModel(self, obs, res=None, val_split=0.3, val_set=None, epochs=10, batch_size=32):
         """
-        Train model
+        Train model on observations and results, or on a tf.data.Dataset of (observation, result) batches padded
+        to the input shape of the model. Datasets are only validated on val_set, another dataset.
         """
         self.model.compile(optimizer=keras.optimizers.Adam(), loss='binary_crossentropy', metrics=['accuracy'])
+        if isinstance(obs, tf.data.Dataset):
+            return self.model.fit(obs, epochs=epochs, validation_data=val_set, verbose=1)
         if val_set:
             train_hist = self.model.fit(np.array(obs), np.array(res), epochs=epochs, batch_size=batch_size,
                                         validation_data=(np.array(val_set[0]), np.array(val_set[1])), verbose=1)
@@ -64,10 +68,13 @@ class BaseCNN:
     def saveModel(self, name, version):
         self.model.save("{}/{}".format(name, version))
 
-    def scoreModel(self, obs, res):
+    def scoreModel(self, obs, res=None):
         """
-        Score model for accuracy, precision and recall
+        Score model for accuracy, precision and recall on observations and results, or on a tf.data.Dataset
         """
+        if isinstance(obs, tf.data.Dataset):
+            return self.scoreDataset(obs)
+
         evaluation = {}
         evaluation['Loss_Acc'] = self.model.evaluate(np.array(obs), np.array(res))
         evaluation['Precision_Recall_Fscore_Support'] = precision_recall_fscore_support(res, self.predict(obs, True),
@@ -75,6 +82,24 @@ class BaseCNN:
         print("Accuracy: {}".format(evaluation['Loss_Acc'][1]))
         return evaluation
 
+    def scoreDataset(self, dataset):
+        """
+        Score model for accuracy, precision and recall on a tf.data.Dataset.
+        Predictions are made batch by batch so they stay aligned with the results of a shuffled or bucketed dataset.
+        """
+        evaluation = {}
+        evaluation['Loss_Acc'] = self.model.evaluate(dataset)
+
+        res = []
+        predictions = []
+        for batch_obs, batch_res in dataset:
+            res.extend(batch_res.numpy().astype(int).tolist())
+            predictions.extend(1 if x > 0.5 else 0 for x in self.model.predict_on_batch(batch_obs))
+        evaluation['Precision_Recall_Fscore_Support'] = precision_recall_fscore_support(res, predictions,
+                                                                                        average='binary')
+        print("Accuracy: {}".format(evaluation['Loss_Acc'][1]))
+        return evaluation
+
     def predict(self, obs, labels=False):
         """
         Get predictions
@@ -2,21 +2,53 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import argparse
+import hashlib
+import os
+import re
+from collections import Counter, OrderedDict
 
 import nltk
+import numpy as np
+import pandas as pd
 from nltk.sentiment import vader
 
-nltk.download('vader_lexicon')  # Model download
+SENTIMENT_CACHE_SIZE = 100000
+# NLTK resources are looked up here before the NLTK data path, populate it to run without network access
+NLTK_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nltk_data')
+VADER_LEXICON = 'sentiment/vader_lexicon.zip'
+
+
+def loadNltkResource(resource, package, directory=NLTK_DATA_DIR):
+    """
+    Function to make an NLTK resource available, downloading it to directory only if it is not found locally.
+    Parameters:
+        resource - path of the resource in the NLTK data directories
+        package - NLTK package containing the resource
+        directory - local NLTK data directory
+    Returns: None
+    """
+    if directory not in nltk.data.path:
+        nltk.data.path.insert(0, directory)
+    try:
+        nltk.data.find(resource)
+    except LookupError:
+        nltk.download(package, download_dir=directory)  # Model download
 
 
 class CommentAnalyzer:
-    def __init__(self, words):
+    def __init__(self, words, sentiment_cache_size=SENTIMENT_CACHE_SIZE):
         """
         Constructors form a dictionary to be used for counting.
-        Parameters: words - list of words to count
+        Parameters:
+            words - list of words to count
+            sentiment_cache_size - maximum number of sentiment scores kept for repeated comments
         """
         self.word_count = {word.lower(): 0 for word in words}  # Create dictionary with list items as key
+        self.word_matcher = self.compileWords(self.word_count)
+        loadNltkResource(VADER_LEXICON, 'vader_lexicon')
         self.vader_sentiment = vader.SentimentIntensityAnalyzer()  # Initialize sentiment analysis model
+        self.sentiment_cache = OrderedDict()  # Least recently used scores are evicted first
+        self.sentiment_cache_size = sentiment_cache_size
 
     def analyzeComment(self, comment):
         """
@@ -32,6 +64,38 @@ class CommentAnalyzer:
         result['Code Blocks'] = self.getCodeBlockCount(cleaned_comment)  # Determine code block count
         return result
 
+    def analyzeComments(self, comments):
+        """
+        Method to get desired features from a list of comments. Identical comments are only analyzed once.
+        Parameters: comments - list of strings.
+        Returns: dataframe with one row of features per comment
+        """
+        unique_comments = {}  # Position of every distinct comment in the unique lists
+        word_counts = []
+        sentiments = []
+        code_blocks = []
+        positions = []
+        for comment in comments:
+            if comment not in unique_comments:
+                unique_comments[comment] = len(sentiments)
+                cleaned_comment = self.preProcess(comment)
+                word_counts.append(self.countWordsSparse(cleaned_comment))
+                sentiments.append(self.getSentiment(comment))
+                code_blocks.append(self.getCodeBlockCount(cleaned_comment))
+            positions.append(unique_comments[comment])
+
+        # Only words found are set, so long word lists cost no more than short ones
+        word_columns = {word: column for column, word in enumerate(self.word_count)}
+        word_matrix = np.zeros((len(sentiments), len(word_columns)), dtype=np.int64)
+        for row, counts in enumerate(word_counts):
+            for word, count in counts.items():
+                word_matrix[row, word_columns[word]] = count
+
+        result = pd.DataFrame(word_matrix, columns=list(word_columns))
+        result['Sentiment'] = sentiments
+        result['Code Blocks'] = code_blocks
+        return result.take(positions).reset_index(drop=True)
+
     def preProcess(self, text):
         """
         Method to clean and return text.
@@ -50,13 +114,33 @@ class CommentAnalyzer:
         Parameters: comment - string
         Returns: dictionary with word counts
         """
-        words = comment.split(" ")  # Split text into words
-        current_word_count = self.word_count.copy()  # Copy default dict for new count
-        for word in words:  # Iterate over all words
-            if word in self.word_count:
-                current_word_count[word] = current_word_count[word] + 1
+        current_word_count = dict.fromkeys(self.word_count, 0)  # Every word is reported, even if not found
+        current_word_count.update(self.countWordsSparse(comment))
         return current_word_count
 
+    def countWordsSparse(self, comment):
+        """
+        Method to determine the count of words found in a comment with a single pass of the compiled word matcher.
+        Words are matched when they are not part of a longer word, so words next to punctuation are counted.
+        Parameters: comment - string
+        Returns: dictionary with counts of the words found
+        """
+        if self.word_matcher is None:
+            return {}
+        return Counter(self.word_matcher.findall(comment))
+
+    def compileWords(self, words):
+        """
+        Method to compile words to count into a single regular expression.
+        Longer words are tried first, so a word is not counted as part of a longer phrase.
+        Parameters: words - iterable of words
+        Returns: compiled regular expression, None if there are no words
+        """
+        words = sorted((word for word in words if word), key=len, reverse=True)
+        if not words:
+            return None
+        return re.compile(r"(?<!\w)(?:{})(?!\w)".format("|".join(re.escape(word) for word in words)))
+
     def getCodeBlockCount(self, comment):
         """
         Method to determine the code blocks.
@@ -72,15 +156,29 @@ class CommentAnalyzer:
     def getSentiment(self, comment):
         """
         Method to determine sentiment. Parameters: comment - string
+        Scores of recent comments are cached, so repeated bot comments and templated reviews are only scored once.
         Returns: dictionary with positive, negative and neutral scores
         """
-        return self.vader_sentiment.polarity_scores(comment)["compound"]
+        if not isinstance(comment, str):
+            return self.vader_sentiment.polarity_scores(comment)["compound"]
+
+        key = hashlib.sha1(comment.encode("utf-8")).digest()
+        if key in self.sentiment_cache:
+            self.sentiment_cache.move_to_end(key)
+            return self.sentiment_cache[key]
+
+        sentiment = self.vader_sentiment.polarity_scores(comment)["compound"]
+        self.sentiment_cache[key] = sentiment
+        if len(self.sentiment_cache) > self.sentiment_cache_size:
+            self.sentiment_cache.popitem(last=False)
+        return sentiment
 
     def changeWords(self, words):
         """
         Method to change words to count. Parameters: Set new word count with new keys/
         """
         self.word_count = {word: 0 for word in words}
+        self.word_matcher = self.compileWords(self.word_count)
 
 
 if __name__ == "__main__":
@@ -1,15 +1,22 @@
 # Copyright 2021 VMware, Inc.
 # SPDX-License-Identifier: Apache-2.0
 import argparse
+import hashlib
+import json
+import math
 import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
 import utils
 from commentAnalysis import CommentAnalyzer
 
 FILE_NAME_SUFFIX = "annotated"
+SHARDS_PER_WORKER = 4
+AGGREGATES = ["Mean_", "Median_", "Mode_", "Max_", "Presence_Count_"]
 
 
 class Featurizer:
@@ -24,19 +31,17 @@ class Featurizer:
         self.raw_data = None
         self.featurized_data = None
         self.commentAnalyzer = None
+        self.word_list = []
 
     def readRawData(self, filename):
         """
-        Function to read raw data stored as csv
+        Function to read raw data stored as csv or JSON Lines
         Inputs: File location (string) -> input raw data file location
         """
         self.raw_filename = filename
-        self.raw_data = pd.read_csv(filename)
 
-        # Convert Comments and Review Comments to dictionary
-        self.raw_data['Comments'] = self.raw_data['Comments'].apply(lambda comment: utils.string_to_dict(comment))
-        self.raw_data['Review_Comments'] = self.raw_data['Review_Comments'].apply(
-            lambda comment: utils.string_to_dict(comment))
+        # Comments and Review Comments are converted to dictionaries
+        self.raw_data = utils.read_raw_data(filename)
 
     def setupCommentAnalyzer(self, filename):
         """
@@ -49,98 +54,201 @@ class Featurizer:
         if filename:
             with open(filename, 'r') as wordFile:
                 word_list = wordFile.read().replace(" ", "").strip().split(',')
+        self.word_list = word_list
         self.commentAnalyzer = CommentAnalyzer(word_list)
         self.analysis_features = self.analysis_features + word_list
         print("Comment Analyzer Setup")
 
-    def formFeatures(self):
+    def formFeatures(self, workers=1, cache_dir=None):
         """
         Function to create/export dataset with desired features
-        Inputs: Name of file to export (string), export flag (boolean)
-        """
-        features = []  # List of rows to convert to dataframe
-
-        # Iterate over each pull
-        for index, row in self.raw_data.iterrows():
-            row_features = {}  # Dictionary to store row features
-
-            # Pull Request Features
-            for feature in self.retain_pull_features:
-                row_features[feature] = row[feature]
-            pull_analyzed = self.commentAnalyzer.analyzeComment(row["Body"])
-
-            for analysis in pull_analyzed:
-                row_features["Pull_" + analysis] = pull_analyzed[analysis]
-
-            # Comment Features
-            if len(row['Comments']) > 0:
-                temp_df_comments = pd.DataFrame(row['Comments'])
-                all_comment_analysis = []
-
-                for comment_index, comment_row in temp_df_comments.iterrows():
-                    all_comment_analysis.append(self.commentAnalyzer.analyzeComment(comment_row["Body"]))
-
-                all_comment_analysis = pd.DataFrame(
-                    data=all_comment_analysis)  # Form dataset of all individual comment features
-
-                # Aggregate comment features
-                for column in self.analysis_features:
-                    row_features["Comment_Mean_" + column] = all_comment_analysis[column].mean()
-                    row_features["Comment_Median_" + column] = all_comment_analysis[column].median()
-                    row_features["Comment_Mode_" + column] = all_comment_analysis[column].mode()
-                    row_features["Comment_Max_" + column] = all_comment_analysis[column].max()
-                    row_features["Comment_Presence_Count_" + column] = len(
-                        all_comment_analysis[all_comment_analysis[column] > 0.5])
-
-                row_features["Comment_Unique_Users"] = len(temp_df_comments["User"].unique())
-                row_features["First_Comment"] = min(temp_df_comments["Created_At"])
-            else:  # If there are no comment set to none
-                for column in self.analysis_features:
-                    row_features["Comment_Mean_" + column] = None
-                    row_features["Comment_Median_" + column] = None
-                    row_features["Comment_Mode_" + column] = None
-                    row_features["Comment_Max_" + column] = None
-                    row_features["Comment_Presence_Count_" + column] = None
-
-                row_features["Comment_Unique_Users"] = None
-                row_features["First_Comment"] = None
-
-            # Review Features
-            if len(row['Review_Comments']) > 0:
-                temp_df_review_comments = pd.DataFrame(row['Review_Comments'])
-                all_review_comment_analysis = []
-
-                for review_comment_index, review_comment_row in temp_df_review_comments.iterrows():
-                    all_review_comment_analysis.append(self.commentAnalyzer.analyzeComment(review_comment_row["Body"]))
-                all_review_comment_analysis = pd.DataFrame(data=all_review_comment_analysis)
-
-                # Aggregate review features
-                for column in all_review_comment_analysis:
-                    row_features["Review_Comment_Mean_" + column] = all_review_comment_analysis[column].mean()
-                    row_features["Review_Comment_Median_" + column] = all_review_comment_analysis[column].median()
-                    row_features["Review_Comment_Mode_" + column] = all_review_comment_analysis[column].mode()
-                    row_features["Review_Comment_Max_" + column] = all_review_comment_analysis[column].max()
-                    row_features["Review_Comment_Presence_Count_" + column] = len(
-                        all_review_comment_analysis[all_review_comment_analysis[column] > 0.5])
-
-                row_features["Review_Comment_Unique_Users"] = len(temp_df_review_comments["User"].unique())
-                row_features["First_Review_Comment"] = min(temp_df_review_comments["Created_At"])
-            else:  # If there are no reviews set to none
-                for column in self.analysis_features:
-                    row_features["Review_Comment_Mean_" + column] = None
-                    row_features["Review_Comment_Median_" + column] = None
-                    row_features["Review_Comment_Mode_" + column] = None
-                    row_features["Review_Comment_Max_" + column] = None
-                    row_features["Review_Comment_Presence_Count_" + column] = None
-
-                row_features["Review_Comment_Unique_Users"] = None
-                row_features["First_Review_Comment"] = None
-
-            # Add pull features to list of row features
-            features.append(row_features)
+        Inputs: Number of processes (int) -> pulls are sharded across a pool of processes if not 1, all cpus if None,
+                Cache directory (string) -> features of pulls not updated since the last run are read from it
+        """
+        if cache_dir is None or "Updated_At" not in self.raw_data:
+            return self.shardFeatures(self.raw_data, workers)
+
+        # Features are cached per raw data file and feature set, keyed by pull number and last update
+        cache_file = self.getCacheFile(cache_dir)
+        keys = pd.MultiIndex.from_frame(self.raw_data[["Number", "Updated_At"]])
+        cached = pd.read_pickle(cache_file) if os.path.exists(cache_file) else pd.DataFrame(
+            index=pd.MultiIndex.from_tuples([], names=keys.names))
+        hits = keys.isin(cached.index)
+        print("{} of {} pulls read from the feature cache".format(hits.sum(), len(hits)))
+
+        cached_features = cached.loc[keys[hits]]
+        new_features = self.shardFeatures(self.raw_data[~hits], workers)
+        cached_features.index = np.flatnonzero(hits)
+        new_features.index = np.flatnonzero(~hits)
+        export_df = pd.concat([cached_features, new_features]).sort_index()
+        export_df = export_df[self.featureColumns(self.raw_data)].reset_index(drop=True)
+
+        # Only the pulls of this run are kept, so edited pulls do not leave stale entries
+        os.makedirs(cache_dir, exist_ok=True)
+        updated_cache = export_df.set_index(keys)
+        updated_cache[~updated_cache.index.duplicated()].to_pickle(cache_file)
+        return export_df
+
+    def getCacheFile(self, cache_dir):
+        """
+        Function to get the feature cache file of the raw data file and the feature set
+        Inputs: Cache directory (string)
+        """
+        feature_set = json.dumps([self.retain_pull_features, self.analysis_features, self.word_list])
+        feature_set_hash = hashlib.sha256(feature_set.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(cache_dir, "{}_{}.pkl".format(Path(self.raw_filename).stem, feature_set_hash))
+
+    def shardFeatures(self, raw_data, workers=1):
+        """
+        Function to form features of pulls, sharded across a pool of processes
+        Inputs: Raw data (dataframe), Number of processes (int) -> all cpus if None
+        """
+        if workers == 1 or len(raw_data) < 2:
+            return self.featurize(raw_data)
+
+        workers = workers or os.cpu_count() or 1
+        shard_size = math.ceil(len(raw_data) / (workers * SHARDS_PER_WORKER))
+        shards = [raw_data.iloc[start:start + shard_size] for start in range(0, len(raw_data), shard_size)]
+
+        # Every worker builds its own Comment Analyzer once, shards are returned in their original order
+        initargs = (self.retain_pull_features, self.analysis_features, self.word_list)
+        with ProcessPoolExecutor(max_workers=workers, initializer=initWorker, initargs=initargs) as executor:
+            featurized_shards = list(executor.map(featurizeShard, shards))
+        # A shard without any value of a column keeps it as object, infer the dtype the whole column gets serially
+        return pd.concat(featurized_shards, ignore_index=True).infer_objects()
+
+    def featureColumns(self, raw_data):
+        """
+        Function to get the columns formed by featurize, in their order
+        Inputs: Raw data (dataframe)
+        """
+        analysis_columns = list(self.commentAnalyzer.word_count) + ["Sentiment", "Code Blocks"]
+        columns = self.retain_pull_features + ["Pull_" + column for column in analysis_columns]
+        for prefix, first_feature, comment_columns in [
+                ("Comment_", "First_Comment", self.analysis_features),
+                ("Review_Comment_", "First_Review_Comment", self.reviewColumns(raw_data))]:
+            for column in comment_columns:
+                columns += [prefix + aggregate + column for aggregate in AGGREGATES]
+            columns += [prefix + "Unique_Users", first_feature]
+        return columns
+
+    def reviewColumns(self, raw_data):
+        """
+        Function to get the order of review features, which follows the analysis columns if the first pull has reviews
+        Inputs: Raw data (dataframe)
+        """
+        if len(raw_data["Review_Comments"].iloc[0]) > 0:
+            return list(self.commentAnalyzer.word_count) + ["Sentiment", "Code Blocks"]
+        return self.analysis_features
+
+    def featurize(self, raw_data):
+        """
+        Function to form features of pulls
+        Inputs: Raw data (dataframe) -> pulls to featurize
+        """
+        if len(raw_data) == 0:
+            return pd.DataFrame()
+        raw_data = raw_data.reset_index(drop=True)  # Comments are grouped by the position of their pull
+        features = {}  # Columns of the featurized dataset
+
+        # Pull Request Features
+        for feature in self.retain_pull_features:
+            features[feature] = raw_data[feature].tolist()
+        pull_analyzed = self.commentAnalyzer.analyzeComments(raw_data["Body"].tolist())
+
+        for analysis in pull_analyzed:
+            features["Pull_" + analysis] = pull_analyzed[analysis].tolist()
+
+        # Comment Features
+        features.update(self.aggregateComments(raw_data, "Comments", "Comment_", "First_Comment",
+                                               self.analysis_features))
+
+        # Review Features
+        features.update(self.aggregateComments(raw_data, "Review_Comments", "Review_Comment_", "First_Review_Comment",
+                                               self.reviewColumns(raw_data)))
+
         export_df = pd.DataFrame(data=features)
         return export_df
 
+    def aggregateComments(self, raw_data, comment_column, prefix, first_feature, analysis_columns):
+        """
+        Function to aggregate the analysis of the comments of every pull.
+        All comments are exploded into one table, analyzed in a batch and aggregated with a single groupby.
+        Pulls without comments get NaN for every numeric feature and None for the modes and the first comment,
+        so shards without any comments keep the dtypes of the other shards.
+        Inputs: Raw data (dataframe), Comment column (string), Feature prefix (string),
+                First comment feature (string), Analysis columns (list) -> order of the aggregated features
+        """
+        comments = raw_data[comment_column].explode().dropna()
+        comments = pd.DataFrame(comments.tolist(), index=comments.index)
+        features = {}
+        if len(comments) == 0:
+            for column in analysis_columns:
+                for aggregate in AGGREGATES:
+                    features[prefix + aggregate + column] = [np.nan] * len(raw_data)
+                features[prefix + "Mode_" + column] = [None] * len(raw_data)
+            features[prefix + "Unique_Users"] = [np.nan] * len(raw_data)
+            features[first_feature] = [None] * len(raw_data)
+            return features
+
+        # Form dataset of all individual comment features, indexed by the position of their pull
+        all_analysis = self.commentAnalyzer.analyzeComments(comments["Body"].tolist())
+        all_analysis.index = comments.index
+        grouped = all_analysis.groupby(level=0)
+        aggregated = grouped.agg(["mean", "median", "max"]).reindex(raw_data.index)
+        presence_counts = (all_analysis > 0.5).groupby(level=0).sum().reindex(raw_data.index)
+
+        # Aggregate comment features
+        for column in analysis_columns:
+            features[prefix + "Mean_" + column] = aggregated[(column, "mean")]
+            features[prefix + "Median_" + column] = aggregated[(column, "median")]
+            features[prefix + "Mode_" + column] = self.getModes(all_analysis[column], len(raw_data))
+            features[prefix + "Max_" + column] = aggregated[(column, "max")]
+            features[prefix + "Presence_Count_" + column] = presence_counts[column]
+
+        comment_groups = comments.groupby(level=0)
+        features[prefix + "Unique_Users"] = comment_groups["User"].nunique(dropna=False).reindex(raw_data.index)
+        first_comments = comment_groups["Created_At"].min().reindex(raw_data.index)
+        features[first_feature] = first_comments.astype(object).where(first_comments.notna(), None).tolist()
+        return features
+
+    def getModes(self, analysis, pull_count):
+        """
+        Function to get the modes of an analysis column for every pull, as series like Series.mode returns
+        Inputs: Analysis (series) -> indexed by the position of the pull of every comment, Number of pulls (int)
+        """
+        counts = analysis.groupby([analysis.index, analysis]).size()
+        modes = counts[counts == counts.groupby(level=0).transform("max")]
+
+        modal_values = [[] for _ in range(pull_count)]
+        for position, value in zip(modes.index.get_level_values(0), modes.index.get_level_values(1)):
+            modal_values[position].append(value)
+        return [pd.Series(values, name=analysis.name, dtype=analysis.dtype) if values else None
+                for values in modal_values]
+
+
+# Featurizer of the current worker process
+worker_featurizer = None
+
+
+def initWorker(retain_features, analysis_features, word_list):
+    """
+    Function to set up the Featurizer of a worker process of formFeatures
+    Inputs: Retained Features (list), Analysis Features (list) including words, Words to count (list)
+    """
+    global worker_featurizer
+    worker_featurizer = Featurizer(retain_features, analysis_features)
+    worker_featurizer.word_list = word_list
+    worker_featurizer.commentAnalyzer = CommentAnalyzer(word_list)
+
+
+def featurizeShard(shard):
+    """
+    Function to form features of a shard of pulls in a worker process of formFeatures
+    Inputs: Raw data shard (dataframe)
+    """
+    return worker_featurizer.featurize(shard)
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Form features from raw data.')
@@ -150,7 +258,13 @@ if __name__ == "__main__":
                                                              'constructed like this: <rawdatafile>{'
                                                              'suffix}.csv'.format(suffix=FILE_NAME_SUFFIX))
 
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes featurizing pulls, 0 uses all available cpus. Defaults to 1.')
+    parser.add_argument('--cache', required=False,
+                        help='Directory of the feature cache. Only pulls updated since the last run are analyzed.')
     args = parser.parse_args()
+    if args.workers < 0:
+        parser.error('--workers cannot be negative')
 
     RETAINED_FEATURES = ["Number", "URL", "Title", "State", "Body", "Deletions", "Additions", "User", "Comments_Num",
                          "Commits_Num", "Created_At", "Closed_At", "Merged", "Merged_At", "Review_Comments_Num"]
@@ -159,6 +273,6 @@ if __name__ == "__main__":
     featurizer = Featurizer(RETAINED_FEATURES, COMMENT_ANALYSIS_FEATURES)
     featurizer.readRawData(args.rawdatafile)
     featurizer.setupCommentAnalyzer(args.words)
-    df = featurizer.formFeatures()
+    df = featurizer.formFeatures(args.workers or None, cache_dir=args.cache)
     file_name = utils.construct_file_name(args.name, args.rawdatafile, FILE_NAME_SUFFIX)
     utils.export_to_cvs(df, file_name)
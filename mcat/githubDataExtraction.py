@@ -2,27 +2,142 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import argparse
-import datetime
+import json
 import os
+import random
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
 
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
 
 from mcat import utils
+from mcat.pageCheckpoint import PageCheckpoint
+from mcat.rateLimiter import TokenPool
+from mcat.responseCache import RECORD, REPLAY, ResponseCache
+
+CHECKPOINTS_DIR = "checkpoints"
+COMPLETED_FILE = "completed.json"  # Exports completed by the current run, skipped when the run is resumed
+MAX_PAGE_SIZE = 100
+MIN_PAGE_SIZE = 5
+PAGE_SIZE_GROWTH_PAGES = 3  # Number of successful pages before the page size is doubled again
+NESTED_BATCH_SIZE = 10  # Number of comment or review connections fetched by one second pass request
+GRAPHQL_URL = 'https://api.github.com/graphql'
+REQUEST_TIMEOUT = (10, 60)  # Seconds to connect and to wait for the response of a page
+MAX_QUERY_NODES = 500000  # Largest number of nodes GitHub allows a single graphql query to request
+NESTED_PAGE_SIZE = 100  # Number of comments, reviews and reactions requested per pull request or comment
+
+# Templates of the query fetching the first page of pull requests of several repos using aliases
+FIRST_PAGES_QUERY = """query ({declarations}) {{
+{selections}
+    rateLimit {{
+        cost
+        remaining
+        resetAt
+    }}
+}}
+"""
+FIRST_PAGE_SELECTION = """    r{index}: repository(owner: $owner, name: $repo{index}) {{
+        pullRequests(first: $pageSize) {{
+            nodes {{
+                ...PullRequestFields
+            }}
+            pageInfo {{
+                endCursor
+                hasNextPage
+            }}
+        }}
+    }}"""
+
+# Templates of the second pass query paging comments and reviews of several pull requests using aliases
+REMAINING_COMMENTS_QUERY = """query ({declarations}) {{
+    repository(owner: $owner, name: $repo) {{
+{selections}
+    }}
+    rateLimit {{
+        cost
+        remaining
+        resetAt
+    }}
+}}
+"""
+REMAINING_COMMENTS_SELECTION = """        pr{index}: pullRequest(number: $number{index}) {{
+            {connection}(first: 100, after: $cursor{index}) {{
+                nodes {{
+                    ...{fragment}
+                }}
+                pageInfo {{
+                    endCursor
+                    hasNextPage
+                }}
+            }}
+        }}"""
+
+
+class GraphQLError(requests.RequestException):
+    """
+    Exception raised when GitHub answers a graphql query with errors and without data
+    """
+
+
+def nodes_per_pull_request(reaction_flag=False):
+    """
+    Function to count the nodes one pull request of a page adds to the node limit of a graphql query: the pull
+    request, its comments and reviews, and the reactions of every comment if reactions are fetched
+    """
+    nodes = 1 + 2 * NESTED_PAGE_SIZE
+    if reaction_flag:
+        nodes += NESTED_PAGE_SIZE * NESTED_PAGE_SIZE
+    return nodes
+
+
+def create_session(pool_size=10):
+    """
+    Function to create a requests session keeping up to pool_size connections to GitHub alive, so the TLS
+    handshake is not repeated for every request. Responses are requested gzip compressed.
+    """
+    session = requests.Session()
+    session.headers.update({'Accept-Encoding': 'gzip'})
+    session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+    return session
 
 
 class GithubDataExtractor:
-    def __init__(self, access_token, organization):
+    def __init__(self, access_token, organization, token_pool=None, pool_size=10, response_cache=None):
         """
-        Constructor requires an access token to start a Github session, and specifies instance variables
+        Constructor requires an access token, or a list of access tokens, to start a Github session, and specifies
+        instance variables. Requests are routed to the token with the most remaining rate limit budget.
+        A token pool can be passed in to share the rate limit budgets between several extractors.
+        The session keeps up to pool_size connections alive, one per concurrent worker.
+        Responses are recorded to and replayed from response_cache if specified.
         """
         self.reaction_flag = False
         self.organization = organization
+        access_tokens = [access_token] if isinstance(access_token, str) else list(access_token)
+        self.token_pool = token_pool if token_pool is not None else TokenPool(access_tokens)
+        self.session = create_session(pool_size)
+        self.response_cache = response_cache
+        self.watermark_lock = threading.Lock()
+        self.query_costs = {}
+        self.node_limit_page_sizes = {}  # Page size each query shrank to after it exceeded the node limit
+        self.backoff_base = 1
+        self.max_backoff = 60
         self.query_repos = self.load_query('repos.graphql')
-        self.query_pull_requests_without_reactions = self.load_query('pull_requests_without_reactions.graphql')
-        self.query_pull_requests_with_reactions = self.load_query('pull_requests_with_reactions.graphql')
-        self.headers = {'Authorization': 'bearer ' + access_token}
+        self.fragment_comment_fields = self.load_query('comment_fields.graphql')
+        self.fragment_comment_fields_with_reactions = self.load_query('comment_fields_with_reactions.graphql')
+        self.fragment_review_fields = self.load_query('review_fields.graphql')
+        self.fragments_pull_request_without_reactions = '\n'.join(
+            [self.load_query('pull_request_fields.graphql'), self.fragment_comment_fields, self.fragment_review_fields])
+        self.fragments_pull_request_with_reactions = '\n'.join(
+            [self.load_query('pull_request_fields.graphql'), self.fragment_comment_fields_with_reactions,
+             self.fragment_review_fields])
+        self.query_pull_requests_without_reactions = '\n'.join(
+            [self.load_query('pull_requests.graphql'), self.fragments_pull_request_without_reactions])
+        self.query_pull_requests_with_reactions = '\n'.join(
+            [self.load_query('pull_requests.graphql'), self.fragments_pull_request_with_reactions])
 
     def get_all_repos(self):
         """
@@ -38,12 +153,14 @@ class GithubDataExtractor:
         repositories = [repository.get('name') for repository in repository_list]
         return repositories
 
-    def get_all_pull_requests(self, repo, reaction_flag=False):
+    def get_all_pull_requests(self, repo, reaction_flag=False, updated_since=None, checkpoint=None):
         """
         Method to get all pull requests from a repo
         Parameters:
             repo - string
             reaction_flag - boolean
+            updated_since - ISO 8601 timestamp, only pull requests updated after it are returned if specified
+            checkpoint - optional PageCheckpoint the fetched pages are committed to and resumed from
         Returns: dataframe containing rows of pull requests
         """
         self.reaction_flag = reaction_flag
@@ -56,7 +173,26 @@ class GithubDataExtractor:
             'query': query,
             'variables': {'owner': self.organization, 'repo': repo}
         }
-        pull_request_list = self.run_queries(query=queries_and_variables)
+        if updated_since is None:
+            pull_request_list = self.run_queries(query=queries_and_variables, checkpoint=checkpoint)
+        else:
+            # Most recently updated pull requests come first, stop at the first page reaching the watermark
+            queries_and_variables['variables']['orderBy'] = {'field': 'UPDATED_AT', 'direction': 'DESC'}
+            pull_request_list = self.run_queries(
+                query=queries_and_variables,
+                until=lambda nodes: any(node.get('updatedAt') <= updated_since for node in nodes),
+                checkpoint=checkpoint)
+            pull_request_list = [pr for pr in pull_request_list if pr.get('updatedAt') > updated_since]
+
+        self.fetch_remaining_comments(repo, pull_request_list)
+        return self.pull_requests_to_dataframe(pull_request_list)
+
+    def pull_requests_to_dataframe(self, pull_request_list):
+        """
+        Method to flatten pull requests into a dataframe
+        Parameters: pull_request_list - list of pull requests returned by the pull request queries
+        Returns: dataframe containing rows of pull requests sorted by number
+        """
         pull_data = (self.get_pull_features(pr) for pr in pull_request_list)
         pull_request_df = pd.DataFrame(pull_data)
 
@@ -66,6 +202,130 @@ class GithubDataExtractor:
         except IndexError:
             return pull_request_df
 
+    def get_first_pages(self, repos, reaction_flag=False):
+        """
+        Method to get the first page of pull requests of several repos with a single query using graphql aliases
+        Parameters:
+            repos - list of repository names
+            reaction_flag - boolean
+        Returns: dictionary of repository name to a tuple of the list of pull requests and the page info,
+                 repos that could not be found are left out
+        The page size is lowered so the whole query stays within the node limit of GitHub.
+        """
+        self.reaction_flag = reaction_flag
+        if self.reaction_flag:
+            fragments = self.fragments_pull_request_with_reactions
+        else:
+            fragments = self.fragments_pull_request_without_reactions
+
+        page_size = min(MAX_PAGE_SIZE, MAX_QUERY_NODES // (len(repos) * nodes_per_pull_request(reaction_flag)))
+        declarations = ['$owner: String!', '$pageSize: Int = {}'.format(MAX_PAGE_SIZE)]
+        selections = []
+        variables = {'owner': self.organization, 'pageSize': max(MIN_PAGE_SIZE, page_size)}
+        for index, repo in enumerate(repos):
+            declarations.append('$repo{}: String!'.format(index))
+            selections.append(FIRST_PAGE_SELECTION.format(index=index))
+            variables['repo{}'.format(index)] = repo
+
+        query = FIRST_PAGES_QUERY.format(declarations=', '.join(declarations), selections='\n'.join(selections))
+        response_json = self.execute_query({'query': query + fragments, 'variables': variables})
+
+        first_pages = {}
+        for index, repo in enumerate(repos):
+            repository = response_json['data'].get('r{}'.format(index))
+            if repository is None:
+                print('repository {} not found'.format(repo))
+                continue
+            pull_requests = repository['pullRequests']
+            first_pages[repo] = (pull_requests['nodes'], pull_requests['pageInfo'])
+        return first_pages
+
+    def stream_pull_requests(self, repo, reaction_flag=False, checkpoint=None):
+        """
+        Method to get all pull requests from a repo one page at a time.
+        Unlike get_all_pull_requests only a single page is held in memory and rows are not sorted.
+        Parameters:
+            repo - string
+            reaction_flag - boolean
+            checkpoint - optional PageCheckpoint the fetched pages are committed to and resumed from
+        Returns: generator of dictionaries containing all data of a pull
+        """
+        self.reaction_flag = reaction_flag
+        if self.reaction_flag:
+            query = self.query_pull_requests_with_reactions
+        else:
+            query = self.query_pull_requests_without_reactions
+
+        queries_and_variables = {
+            'query': query,
+            'variables': {'owner': self.organization, 'repo': repo}
+        }
+        for pull_request_list in self.iterate_pages(query=queries_and_variables, checkpoint=checkpoint):
+            self.fetch_remaining_comments(repo, pull_request_list)
+            for pr in pull_request_list:
+                yield self.get_pull_features(pr)
+
+    def fetch_remaining_comments(self, repo, pull_request_list):
+        """
+        Method to page the comments and reviews cut off after the first 100 of each pull request.
+        Connections of several pull requests are fetched by one request using graphql aliases, and the fetched nodes
+        are appended to the pull requests in place.
+        Parameters:
+            repo - string
+            pull_request_list - list of pull requests returned by the pull request queries
+        Returns: None
+        """
+        pending = [(pr, connection) for pr in pull_request_list for connection in ('comments', 'reviews')
+                   if ((pr.get(connection) or {}).get('pageInfo') or {}).get('hasNextPage')]
+
+        while pending:
+            batch = pending[:NESTED_BATCH_SIZE]
+            pending = pending[NESTED_BATCH_SIZE:]
+            print('retrieving remaining comments of {} pull requests...'.format(len(batch)))
+
+            response_json = self.execute_query(self.build_remaining_comments_query(repo, batch))
+            repository = response_json['data']['repository']
+            for index, (pr, connection) in enumerate(batch):
+                fetched = repository['pr{}'.format(index)][connection]
+                pr[connection]['nodes'] = pr[connection].get('nodes', []) + fetched['nodes']
+                pr[connection]['pageInfo'] = fetched['pageInfo']
+                if fetched['pageInfo']['hasNextPage']:
+                    pending.append((pr, connection))
+
+    def build_remaining_comments_query(self, repo, batch):
+        """
+        Method to build a query fetching the next page of several comment or review connections
+        Parameters:
+            repo - string
+            batch - list of tuples of a pull request and the connection to page, 'comments' or 'reviews'
+        Returns: dict of graphql query and variables
+        """
+        declarations = ['$owner: String!', '$repo: String!']
+        selections = []
+        variables = {'owner': self.organization, 'repo': repo}
+        fragments = []
+
+        for index, (pr, connection) in enumerate(batch):
+            fragment = 'CommentFields' if connection == 'comments' else 'ReviewFields'
+            if connection == 'comments' and self.reaction_flag:
+                fragment_text = self.fragment_comment_fields_with_reactions
+            elif connection == 'comments':
+                fragment_text = self.fragment_comment_fields
+            else:
+                fragment_text = self.fragment_review_fields
+            if fragment_text not in fragments:
+                fragments.append(fragment_text)
+
+            declarations += ['$number{}: Int!'.format(index), '$cursor{}: String'.format(index)]
+            selections.append(REMAINING_COMMENTS_SELECTION.format(index=index, connection=connection,
+                                                                  fragment=fragment))
+            variables['number{}'.format(index)] = pr['number']
+            variables['cursor{}'.format(index)] = pr[connection]['pageInfo']['endCursor']
+
+        query = REMAINING_COMMENTS_QUERY.format(declarations=', '.join(declarations),
+                                                selections='\n'.join(selections))
+        return {'query': query + '\n'.join(fragments), 'variables': variables}
+
     def load_query(self, file_name, directory='queries'):
         """
         Method to load graphql queries
@@ -78,66 +338,190 @@ class GithubDataExtractor:
         with open(query_path) as file:
             return file.read()
 
-    def run_queries(self, query):
+    def run_queries(self, query, until=None, checkpoint=None):
         """
         Method to run graphql queries
-        Parameters: query - dict of graphql query and variables
+        Parameters:
+            query - dict of graphql query and variables
+            until - optional function called with the nodes of each page, pagination stops when it returns True
+            checkpoint - optional PageCheckpoint, every page is committed to it and pagination continues from its
+                         last committed cursor
         Returns: json string
         """
-        has_next_page = True
         data = []
+        for nodes in self.iterate_pages(query, until=until, checkpoint=checkpoint):
+            data += nodes
+        return data
+
+    def iterate_pages(self, query, until=None, checkpoint=None):
+        """
+        Method to run graphql queries one page at a time
+        Parameters:
+            query - dict of graphql query and variables
+            until - optional function called with the nodes of each page, pagination stops when it returns True
+            checkpoint - optional PageCheckpoint, every page is committed to it and pagination continues from its
+                         last committed cursor. Committed pages are read back from disk first.
+        Returns: generator of lists of nodes
+        """
+        has_next_page = True
+        points_spent = 0
+        pages = 0
+
+        # Queries declaring $pageSize start with the largest pages, execute_query shrinks them after server errors
+        # and they grow back after successes, up to the largest page within the node limit
+        adaptive_page_size = '$pageSize' in query.get('query', '')
+        successful_pages = 0
+        largest_page_size = MAX_PAGE_SIZE
+        if query.get('query') != self.query_repos:
+            largest_page_size = min(MAX_PAGE_SIZE, MAX_QUERY_NODES // nodes_per_pull_request(self.reaction_flag))
+
+        state = checkpoint.load() if checkpoint is not None else None
+        if state is not None:
+            print('resuming from checkpoint {}'.format(checkpoint.directory))
+            yield from checkpoint.read_pages()
+            has_next_page = state['has_next_page']
+            query['variables']['cursor'] = state['cursor']
 
         while has_next_page:
-            # wait one second to avoid the secondary rate limits
-            time.sleep(1)
+            if adaptive_page_size:
+                if query['query'] in self.node_limit_page_sizes:
+                    largest_page_size = min(largest_page_size, self.node_limit_page_sizes[query['query']])
+                page_size = query['variables'].setdefault('pageSize', largest_page_size)
+
+            response_json = self.execute_query(query)
+
+            if adaptive_page_size:
+                if query['variables']['pageSize'] < page_size:
+                    successful_pages = 0
+                successful_pages += 1
+                if successful_pages >= PAGE_SIZE_GROWTH_PAGES and query['variables']['pageSize'] < largest_page_size:
+                    query['variables']['pageSize'] = min(largest_page_size, query['variables']['pageSize'] * 2)
+                    successful_pages = 0
+
+            rate_limit = response_json['data'].get('rateLimit')
+            if rate_limit is not None:
+                points_spent += rate_limit['cost']
+            pages += 1
+
+            if query['query'] == self.query_repos:
+                org_repos = response_json['data']['organization']['repositories']
+                page_info = org_repos['pageInfo']
+                nodes = org_repos['nodes']
+            else:
+                repo_pull_requests = response_json['data']['repository']['pullRequests']
+                page_info = repo_pull_requests['pageInfo']
+                nodes = repo_pull_requests['nodes']
+
+            end_cursor = page_info['endCursor']
+            has_next_page = page_info['hasNextPage'] and not (until is not None and until(nodes))
+
+            if checkpoint is not None:
+                checkpoint.commit(nodes, end_cursor, has_next_page)
+
+            variables = query['variables']
+            variables['cursor'] = end_cursor
+            query = {'query': query['query'], 'variables': variables}
+
+            yield nodes
+
+        print('spent {} rate limit points on {} pages of {}'.format(
+            points_spent, pages, query['variables'].get('repo', self.organization)))
+
+    def execute_query(self, query):
+        """
+        Method to run a single graphql query, retrying until it succeeds.
+        Responses are read from and recorded to the response cache if one is set. Queries with a pageSize variable
+        ask for smaller pages after server errors.
+        Parameters: query - dict of graphql query and variables
+        Returns: dictionary of the json response
+        """
+        if self.response_cache is not None:
+            cached_response_json = self.response_cache.get(query)
+            if cached_response_json is not None:
+                return cached_response_json
+
+        retries = 0
+        while True:
+            # wait for the shared rate limit budget to avoid the primary and secondary rate limits
+            # the cost of a page is expected to be the cost reported for the previous page of the same query
+            token = self.token_pool.acquire(cost=self.query_costs.get(query.get('query'), 1))
             print('retrieving data...')
 
             try:
-                response = requests.post(url='https://api.github.com/graphql', json=query, headers=self.headers)
-                response_json = response.json()
+                response = self.session.post(url=GRAPHQL_URL, json=query, headers={'Authorization': 'bearer ' + token},
+                                             timeout=REQUEST_TIMEOUT)
+                try:
+                    response_json = response.json()
+                except ValueError:
+                    # Gateway errors may not have a json body
+                    response_json = response.text
                 response_reason = response.reason
                 status_code = response.status_code
 
+                # Refill the budget of the token from X-RateLimit-Remaining and X-RateLimit-Reset
+                self.token_pool.update_from_headers(token, response.headers)
+
                 if status_code == 200:
                     # GitHub graphql has a bug that returns status 200 for exceeding the rate limit
-                    # When a rate limit has exceeded, retries after waiting until rate limit has reset
-                    # The wait time is calculated using returned header X-RateLimit-Reset
+                    # When a rate limit has exceeded, the rate limiter waits until the rate limit has reset
+                    # before the request is retried
                     rate_limit_remaining = response.headers.get('X-RateLimit-Remaining')
                     if rate_limit_remaining == "0":
-                        rate_limit_reset = response.headers.get('X-RateLimit-Reset')
-                        rate_limit_reset_time = datetime.datetime.fromtimestamp(int(rate_limit_reset))
-                        current_time = datetime.datetime.now()
-                        wait_time_seconds = (rate_limit_reset_time - current_time).total_seconds()
-
-                        print('rate limit exceeded, retrying after {} seconds'.format(wait_time_seconds))
-                        time.sleep(wait_time_seconds)
+                        print('rate limit exceeded, retrying after reset')
+                    elif response_json.get('data') is None:
+                        errors = response_json.get('errors', [])
+                        node_limit_exceeded = any(error.get('type') == 'MAX_NODE_LIMIT_EXCEEDED' for error in errors)
+                        if not node_limit_exceeded or query.get('variables', {}).get('pageSize', 0) <= MIN_PAGE_SIZE:
+                            raise GraphQLError('; '.join(error.get('message', str(error)) for error in errors))
+                        # The page asks for more nodes than GitHub allows, retry with a smaller page that later
+                        # pages do not grow beyond
+                        print('retrying due to {}'.format(errors))
+                        self.reduce_page_size(query)
+                        self.node_limit_page_sizes[query['query']] = query['variables']['pageSize']
                     else:
-                        if query['query'] == self.query_repos:
-                            org_repos = response_json['data']['organization']['repositories']
-                            page_info = org_repos['pageInfo']
-                            nodes = org_repos['nodes']
-                        else:
-                            repo_pull_requests = response_json['data']['repository']['pullRequests']
-                            page_info = repo_pull_requests['pageInfo']
-                            nodes = repo_pull_requests['nodes']
-
-                        end_cursor = page_info['endCursor']
-                        has_next_page = page_info['hasNextPage']
-
-                        variables = query['variables']
-                        variables['cursor'] = end_cursor
-                        query = {'query': query['query'], 'variables': variables}
-
-                        data += nodes
+                        # Charge the following requests the points this page actually cost
+                        rate_limit = response_json['data'].get('rateLimit')
+                        if rate_limit is not None:
+                            self.token_pool.update_from_rate_limit(token, rate_limit)
+                            self.query_costs[query['query']] = rate_limit['cost']
+
+                        if self.response_cache is not None:
+                            self.response_cache.put(query, response_json)
+                        return response_json
                 elif status_code in (502, 503, 403, 413, 429):
                     print('retrying due to {} {} {}'.format(status_code, response_reason, response_json))
+                    if status_code in (502, 503):
+                        # The page timed out on GitHub, ask for fewer nodes
+                        self.reduce_page_size(query)
+                    self.wait_before_retry(retries)
+                    retries += 1
                 else:
                     raise requests.HTTPError('{}: {} {}'.format(status_code, response_reason, response_json))
-            except requests.exceptions.ChunkedEncodingError as error:
-                # Broken connection, exception is not thrown to allow retry
+            except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as error:
+                # Broken connection or timeout, exception is not thrown to allow retry with a smaller page
                 print('retrying due to {}'.format(error))
-                pass
-        return data
+                self.reduce_page_size(query)
+                self.wait_before_retry(retries)
+                retries += 1
+
+    def reduce_page_size(self, query):
+        """
+        Method to halve the page size of a query declaring a pageSize variable
+        Parameters: query - dict of graphql query and variables
+        Returns: None
+        """
+        variables = query.get('variables', {})
+        if 'pageSize' in variables:
+            variables['pageSize'] = max(MIN_PAGE_SIZE, variables['pageSize'] // 2)
+
+    def wait_before_retry(self, retries):
+        """
+        Method to wait before retrying a failed request, using exponential backoff with full jitter
+        Parameters: retries - number of consecutive retries of the request so far
+        Returns: None
+        """
+        time.sleep(random.uniform(0, min(self.max_backoff, self.backoff_base * 2 ** retries)))
 
     def list_of_comments(self, comments):
         """
@@ -210,10 +594,192 @@ class GithubDataExtractor:
             "Review_Comments": self.list_of_comments(reviews) if reviews is not None else []
         }
 
-    def retrieve_and_export_pull_request_data(self, repo, reactions_flag, name, organization):
-        df = self.get_all_pull_requests(repo, reactions_flag)
-        file_name = utils.construct_file_name(name, organization, repo)
-        utils.export_to_cvs(df, file_name)
+    def retrieve_and_export_pull_request_data(self, repo, reactions_flag, name, organization, incremental=False,
+                                              resume=False, stream=False, export_format=utils.CSV_FORMAT):
+        if stream or export_format == utils.JSONL_FORMAT:
+            file_name = utils.construct_file_name(name, organization, repo, extension=utils.JSONL_EXTENSION)
+        else:
+            file_name = utils.construct_file_name(name, organization, repo)
+
+        # Pages are checkpointed so a failed extraction can be resumed instead of started over
+        checkpoint = self.get_checkpoint(file_name)
+        if not resume:
+            checkpoint.clear()
+
+        if stream:
+            # Each page is written as soon as it is flattened so memory does not grow with the repo size
+            utils.export_to_jsonl(self.stream_pull_requests(repo, reactions_flag, checkpoint=checkpoint), file_name)
+            checkpoint.clear()
+            return
+
+        if not incremental:
+            df = self.get_all_pull_requests(repo, reactions_flag, checkpoint=checkpoint)
+            utils.export_data_frame(df, file_name)
+            checkpoint.clear()
+            return
+
+        # Only fetch pull requests updated since the last run and merge them into the existing export
+        watermark = self.get_watermark(file_name)
+        started_at = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        df = self.get_all_pull_requests(repo, reactions_flag, updated_since=watermark, checkpoint=checkpoint)
+        if watermark is not None:
+            print('{} pull requests of {} updated since {}'.format(len(df), repo, watermark))
+            df = utils.merge_with_export(df, file_name, key='Number')
+        utils.export_data_frame(df, file_name)
+        if not df.empty:
+            # Pull requests updated while the extraction runs may have been fetched before the update, so the
+            # watermark never passes the start of the extraction
+            self.set_watermark(file_name, min(started_at, df['Updated_At'].max()))
+        checkpoint.clear()
+
+    def get_checkpoint(self, file_name):
+        """
+        Method to get the page checkpoint of an export
+        Parameters: file_name - name of the export
+        Returns: PageCheckpoint
+        """
+        return PageCheckpoint(os.path.join(utils.EXPORTS_DIR, CHECKPOINTS_DIR, Path(file_name).stem))
+
+    def get_completed_exports(self):
+        """
+        Method to get the exports completed by the current run of retrieve_and_export_all_repos
+        Parameters: None
+        Returns: set of export file names
+        """
+        file = os.path.join(utils.EXPORTS_DIR, CHECKPOINTS_DIR, COMPLETED_FILE)
+        if not os.path.exists(file):
+            return set()
+
+        with open(file) as completed_file:
+            return set(json.load(completed_file))
+
+    def set_completed_exports(self, file_names):
+        """
+        Method to record the exports completed by the current run, the file is replaced atomically.
+        An empty set removes the file.
+        Parameters: file_names - set of export file names
+        Returns: None
+        """
+        file = os.path.join(utils.EXPORTS_DIR, CHECKPOINTS_DIR, COMPLETED_FILE)
+        if not file_names:
+            if os.path.exists(file):
+                os.remove(file)
+            return
+
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        with open(file + '.tmp', 'w') as completed_file:
+            json.dump(sorted(file_names), completed_file, indent=2)
+        os.replace(file + '.tmp', file)
+
+    def get_watermark(self, file_name):
+        """
+        Method to get the last updatedAt seen for an export
+        Parameters: file_name - name of the export
+        Returns: ISO 8601 timestamp or None if the export does not exist yet
+        """
+        if not os.path.exists(os.path.join(utils.EXPORTS_DIR, file_name)):
+            return None
+        with self.watermark_lock:
+            return utils.read_watermarks().get(file_name)
+
+    def set_watermark(self, file_name, updated_at):
+        """
+        Method to record the last updatedAt seen for an export
+        Parameters:
+            file_name - name of the export
+            updated_at - ISO 8601 timestamp
+        Returns: None
+        """
+        with self.watermark_lock:
+            watermarks = utils.read_watermarks()
+            watermarks[file_name] = updated_at
+            utils.write_watermarks(watermarks)
+
+    def retrieve_and_export_batched_repos(self, repos, reactions_flag, organization, batch_size=10, workers=1,
+                                          export_format=utils.CSV_FORMAT):
+        """
+        Method to extract and export the pull requests of several repos, fetching the first page of batch_size repos
+        with a single request. Repos with more than one page fall back to per repo pagination.
+        Parameters:
+            repos - list of repository names
+            reactions_flag - boolean
+            organization - string
+            batch_size - number of repos fetched by one request
+            workers - number of repos with more than one page extracted at the same time
+            export_format - utils.CSV_FORMAT or utils.JSONL_FORMAT
+        Returns: list of repos that could not be extracted
+        """
+        # Keep the first pages of a batch within the node limit of a single query
+        max_batch_size = max(1, MAX_QUERY_NODES // (MAX_PAGE_SIZE * nodes_per_pull_request(reactions_flag)))
+        if batch_size > max_batch_size:
+            print('batch size {} exceeds the node limit, fetching {} repos per request'.format(
+                batch_size, max_batch_size))
+            batch_size = max_batch_size
+
+        extension = utils.EXPORT_EXTENSIONS[export_format]
+        large_repos = []
+        for start in range(0, len(repos), batch_size):
+            batch = repos[start:start + batch_size]
+            first_pages = self.get_first_pages(batch, reactions_flag)
+
+            for repo, (pull_request_list, page_info) in first_pages.items():
+                if page_info['hasNextPage']:
+                    large_repos.append(repo)
+                    continue
+                self.fetch_remaining_comments(repo, pull_request_list)
+                df = self.pull_requests_to_dataframe(pull_request_list)
+                utils.export_data_frame(df, utils.construct_file_name(None, organization, repo, extension=extension))
+
+        print('{} of {} repos have more than one page of pull requests'.format(len(large_repos), len(repos)))
+        return self.retrieve_and_export_all_repos(repos=large_repos, reactions_flag=reactions_flag,
+                                                  organization=organization, workers=workers,
+                                                  export_format=export_format)
+
+    def retrieve_and_export_all_repos(self, repos, reactions_flag, organization, workers=1, incremental=False,
+                                      resume=False, stream=False, export_format=utils.CSV_FORMAT):
+        """
+        Method to extract and export the pull requests of several repos concurrently.
+        All workers share the token pool of the extractor.
+        Parameters:
+            repos - list of repository names
+            reactions_flag - boolean
+            organization - string
+            workers - number of repos extracted at the same time
+            incremental - boolean, only fetch pull requests updated since the last run
+            resume - boolean, continue from the checkpoints of a previous run
+            stream - boolean, write pages to JSON Lines exports as they are fetched
+            export_format - utils.CSV_FORMAT or utils.JSONL_FORMAT
+        Returns: list of repos that could not be extracted
+        Completed exports are recorded until every repo is extracted, so a resumed run skips them.
+        """
+        extension = utils.JSONL_EXTENSION if stream else utils.EXPORT_EXTENSIONS[export_format]
+        file_names = {repo: utils.construct_file_name(None, organization, repo, extension=extension) for repo in repos}
+        completed = self.get_completed_exports() if resume else set()
+        pending_repos = [repo for repo in repos if file_names[repo] not in completed]
+        if len(pending_repos) < len(repos):
+            print('skipping {} repos completed by the previous run'.format(len(repos) - len(pending_repos)))
+        self.set_completed_exports(completed)
+
+        failed_repos = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self.retrieve_and_export_pull_request_data, repo=repo,
+                                       reactions_flag=reactions_flag, name=None, organization=organization,
+                                       incremental=incremental, resume=resume, stream=stream,
+                                       export_format=export_format): repo
+                       for repo in pending_repos}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except requests.RequestException as error:
+                    print('failed to extract {}: {}'.format(futures[future], error))
+                    failed_repos.append(futures[future])
+                else:
+                    completed.add(file_names[futures[future]])
+                    self.set_completed_exports(completed)
+
+        if not failed_repos:
+            self.set_completed_exports(set())
+        return failed_repos
 
 
 if __name__ == "__main__":
@@ -223,18 +789,76 @@ if __name__ == "__main__":
     parser.add_argument('--reactions', action='store_true', default=False, help='Flag to extract reactions')
     parser.add_argument('-n', "--name",
                         help='Output file name. If not specified, the name is constructed like this: <organization>_<repo>.csv')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Number of repos extracted concurrently when --repo is not specified, 0 uses the number '
+                             'of available cpus. Defaults to 1.')
+    parser.add_argument('--incremental', action='store_true', default=False,
+                        help='Only fetch pull requests updated since the last run and merge them into the existing '
+                             'export.')
+    parser.add_argument('--resume', action='store_true', default=False,
+                        help='Continue from the pages checkpointed by a previous run that did not complete.')
+    parser.add_argument('--stream', action='store_true', default=False,
+                        help='Write every page to a JSON Lines export as soon as it is fetched instead of holding the '
+                             'whole repo in memory. Rows are not sorted.')
+
+    parser.add_argument('--format', choices=[utils.CSV_FORMAT, utils.JSONL_FORMAT], default=utils.CSV_FORMAT,
+                        help='Export format. {} keeps comments and reviews as lists of objects so they are read back '
+                             'without parsing strings. --stream always writes {}. Defaults to {}.'.format(
+                            utils.JSONL_FORMAT, utils.JSONL_FORMAT, utils.CSV_FORMAT))
+    parser.add_argument('--batch-size', type=int,
+                        help='Fetch the first page of pull requests of this many repos with a single request when '
+                             '--repo is not specified. Only repos with more pages are paginated one by one.')
+    parser.add_argument('--cache', metavar='DIRECTORY',
+                        help='Directory GitHub responses are recorded to and replayed from.')
+    parser.add_argument('--cache-mode', choices=[RECORD, REPLAY], default=RECORD,
+                        help='{}: replay cached responses and record missing ones, {}: only replay cached responses '
+                             'without network access. Defaults to {}.'.format(RECORD, REPLAY, RECORD))
+    parser.add_argument('--cache-ttl', type=float,
+                        help='Number of seconds a cached response stays valid. Cached responses never expire if not '
+                             'specified.')
 
     args = parser.parse_args()
-    ACCESS_TOKEN = os.environ["GH_TOKEN"]  # Access Github token from environment for security purposes
-    extractor = GithubDataExtractor(ACCESS_TOKEN, args.organization)
+    if args.workers < 0:
+        parser.error('--workers cannot be negative')
+    if args.stream and args.incremental:
+        parser.error('--stream cannot be combined with --incremental')
+    if args.batch_size is not None and (args.incremental or args.stream or args.resume):
+        parser.error('--batch-size cannot be combined with --incremental, --stream or --resume')
+    if args.cache_mode == REPLAY and not args.cache:
+        parser.error('--cache-mode {} requires --cache'.format(REPLAY))
+
+    # Access Github tokens from environment for security purposes
+    # GH_TOKENS holds a comma separated pool of tokens, GH_TOKEN a single token
+    if os.environ.get("GH_TOKENS"):
+        ACCESS_TOKENS = [token.strip() for token in os.environ["GH_TOKENS"].split(",") if token.strip()]
+    elif args.cache_mode == REPLAY:
+        # Replayed responses are never sent to GitHub
+        ACCESS_TOKENS = [os.environ.get("GH_TOKEN", "offline")]
+    else:
+        ACCESS_TOKENS = [os.environ["GH_TOKEN"]]
+    cache = ResponseCache(args.cache, mode=args.cache_mode, ttl=args.cache_ttl) if args.cache else None
+    workers = args.workers or os.cpu_count() or 1
+    extractor = GithubDataExtractor(ACCESS_TOKENS, args.organization, pool_size=workers,
+                                    response_cache=cache)
 
     if args.repo is None:
         # Extract data for all repositories in organization
         repos = extractor.get_all_repos()
-        for repo in repos:
-            extractor.retrieve_and_export_pull_request_data(repo=repo, reactions_flag=args.reactions, name=None,
-                                                            organization=args.organization)
+        if args.batch_size:
+            failed = extractor.retrieve_and_export_batched_repos(repos=repos, reactions_flag=args.reactions,
+                                                                 organization=args.organization,
+                                                                 batch_size=args.batch_size, workers=workers,
+                                                                 export_format=args.format)
+        else:
+            failed = extractor.retrieve_and_export_all_repos(repos=repos, reactions_flag=args.reactions,
+                                                             organization=args.organization, workers=workers,
+                                                             incremental=args.incremental, resume=args.resume,
+                                                             stream=args.stream, export_format=args.format)
+        if failed:
+            print('Extraction failed for: {}'.format(', '.join(failed)))
     else:
         # Extract data for an individual repository
         extractor.retrieve_and_export_pull_request_data(repo=args.repo, reactions_flag=args.reactions, name=args.name,
-                                                        organization=args.organization)
+                                                        organization=args.organization, incremental=args.incremental,
+                                                        resume=args.resume, stream=args.stream,
+                                                        export_format=args.format)
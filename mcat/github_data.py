@@ -1,4 +1,7 @@
 import argparse
+import datetime
+import os
+from concurrent.futures import ProcessPoolExecutor
 
 import pandas as pd
 
@@ -18,54 +21,67 @@ class GitHubData:
 
     def read_raw_data(self):
         """
-        Function to read raw data stored as csv
+        Function to read raw data stored as csv or JSON Lines
         """
-        self.raw_data = pd.read_csv(self.raw_filename)
+        # Comments and Review Comments are converted to dictionaries
+        self.raw_data = utils.read_raw_data(self.raw_filename)
 
-        # Convert Comments and Review Comments to dictionary
-        self.raw_data['Comments'] = self.raw_data['Comments'].apply(lambda comment: utils.string_to_dict(comment))
-        self.raw_data['Review_Comments'] = self.raw_data['Review_Comments'].apply(lambda comment: utils.string_to_dict(comment))
-
-    def reformat_data(self):
+    def reformat_data(self, workers=1):
         """
         Function to reformat raw data as form conversation strings given communication on a pull requests
+        Conversations are merged in a pool of workers processes if workers is not 1, all available cpus if None
         """
+        rows = self.raw_data.to_dict("records")
 
-        # Store each interaction and pull URL for export
-        conversations = []
-        pull_urls = []
-        pull_numbers = []
-
-        for index, row in self.raw_data.iterrows():
-            # Make pull message
-            conversations.append(self.merge_comments(row))
-            pull_urls.append(row["URL"])
-            pull_numbers.append(row["Number"])
+        # Make pull messages
+        if workers != 1 and len(rows) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                chunk_size = max(1, len(rows) // (4 * (workers or os.cpu_count() or 1)))
+                conversations = list(executor.map(self.merge_comments, rows, chunksize=chunk_size))
+        else:
+            conversations = [self.merge_comments(row) for row in rows]
 
         # Export conversation field dataset
         export_df = pd.DataFrame()
-        export_df["Number"] = pull_numbers
-        export_df["URL"] = pull_urls
+        export_df["Number"] = self.raw_data["Number"].tolist()
+        export_df["URL"] = self.raw_data["URL"].tolist()
         export_df["Thread"] = conversations
         return export_df
 
-    def merge_comments(self, row):
+    def reformat_data_in_chunks(self, chunk_size, workers=1):
+        """
+        Function to read and reformat raw data chunk_size pull requests at a time
+        """
+        for chunk in utils.read_raw_data_chunks(self.raw_filename, chunk_size):
+            self.raw_data = chunk
+            yield self.reformat_data(workers)
+
+    @staticmethod
+    def merge_comments(row):
         """
         merge comments and review comments to form a conversation
         """
-        conversation = "{} ({}) : {}\n{}".format(row["User"], row["Created_At"], row["Title"], row["Body"])
-        temp_df_comments = pd.DataFrame(row['Comments'])
-        temp_df_review_comments = pd.DataFrame(row["Review_Comments"])
-        if len(temp_df_comments) > 0 or len(temp_df_review_comments) > 0:
-            all_comments = temp_df_comments.append(temp_df_review_comments)
-            all_comments['Created_At'] = pd.to_datetime(all_comments['Created_At'])
-            all_comments = all_comments.sort_values(by=['Created_At'])  # Sort data so as to export in order
+        conversation = ["{} ({}) : {}\n{}".format(row["User"], row["Created_At"], row["Title"], row["Body"])]
+        all_comments = list(row["Comments"]) + list(row["Review_Comments"])
+
+        # Sort once on parsed timestamps so as to export in order, comments without a timestamp go last
+        timestamped_comments = [(parse_timestamp(comment.get("Created_At")), comment) for comment in all_comments]
+        timestamped_comments.sort(key=lambda item: (item[0] is None, item[0] or 0))
 
-            for comment_index, comment_row in all_comments.iterrows():
-                conversation = conversation + "\n{} ({}) : {}".format(comment_row["User"],
-                                                                      comment_row["Created_At"],
-                                                                      comment_row["Body"])
-        return conversation.encode("ascii", "ignore").decode()
+        for created_at, comment in timestamped_comments:
+            conversation.append("{} ({}) : {}".format(comment.get("User"), "NaT" if created_at is None else created_at,
+                                                      comment.get("Body")))
+        return "\n".join(conversation).encode("ascii", "ignore").decode()
+
+
+def parse_timestamp(timestamp):
+    """
+    Parse an ISO 8601 timestamp of the GitHub API, returns None for missing timestamps
+    """
+    if not isinstance(timestamp, str):
+        return None
+    # fromisoformat only accepts the Z suffix from python 3.11
+    return datetime.datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
 
 
 if __name__ == "__main__":
@@ -74,11 +90,24 @@ if __name__ == "__main__":
     parser.add_argument('-n', '--name', required=False, help='Output file name. If not specified, the name is '
                                                              'constructed like this: <rawdatafile>{'
                                                              'suffix}.csv'.format(suffix=FILE_NAME_SUFFIX))
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Number of processes merging conversations, 0 uses all available cpus. Defaults to 1.')
+    parser.add_argument('-c', '--chunk-size', type=int, required=False,
+                        help='Read and reformat this many pull requests at a time and append them to the output, '
+                             'so memory does not grow with the size of the raw data file.')
     args = parser.parse_args()
+    if args.workers < 0:
+        parser.error('--workers cannot be negative')
 
+    workers = args.workers or None
     data_reformat = GitHubData(args.rawdatafile)
-    data_reformat.read_raw_data()
-
-    df = data_reformat.reformat_data()
     file_name = utils.construct_file_name(args.name, args.rawdatafile, FILE_NAME_SUFFIX)
-    utils.export_to_cvs(df, file_name)
+
+    if args.chunk_size:
+        utils.export_chunks_to_cvs(data_reformat.reformat_data_in_chunks(args.chunk_size, workers),
+                                   file_name)
+    else:
+        data_reformat.read_raw_data()
+
+        df = data_reformat.reformat_data(workers)
+        utils.export_to_cvs(df, file_name)
@@ -0,0 +1,80 @@
+# Copyright 2021 VMware, Inc.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import os
+import shutil
+
+
+class PageCheckpoint:
+    def __init__(self, directory):
+        """
+        Constructor sets the directory the pages of one paginated query are checkpointed to.
+        Nodes of every page are appended to nodes.jsonl, one line per page. The cursor of the last committed page and
+        the size of nodes.jsonl at that point are stored in state.json, which is replaced atomically.
+        Parameters: directory - checkpoint directory
+        """
+        self.directory = directory
+        self.nodes_file = os.path.join(directory, 'nodes.jsonl')
+        self.state_file = os.path.join(directory, 'state.json')
+
+    def load(self):
+        """
+        Method to load the state of the last committed page
+        Parameters: None
+        Returns: dictionary with cursor, has_next_page and offset keys, None if nothing was committed
+        """
+        if not os.path.exists(self.state_file):
+            return None
+
+        with open(self.state_file) as file:
+            return json.load(file)
+
+    def read_pages(self):
+        """
+        Method to read committed pages one at a time. Data written after the last commit is ignored.
+        Parameters: None
+        Returns: generator of lists of nodes
+        """
+        state = self.load()
+        if state is None:
+            return
+
+        with open(self.nodes_file) as file:
+            while file.tell() < state['offset']:
+                yield json.loads(file.readline())
+
+    def commit(self, nodes, cursor, has_next_page):
+        """
+        Method to durably append a page and its cursor
+        Parameters:
+            nodes - list of nodes of the page
+            cursor - end cursor of the page
+            has_next_page - boolean
+        Returns: None
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        state = self.load()
+
+        with open(self.nodes_file, 'a') as file:
+            # Drop a partially written page left by a crash before the last commit completed
+            file.truncate(state['offset'] if state is not None else 0)
+            file.write(json.dumps(nodes) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+            offset = file.tell()
+
+        state = {'cursor': cursor, 'has_next_page': has_next_page, 'offset': offset}
+        with open(self.state_file + '.tmp', 'w') as file:
+            json.dump(state, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(self.state_file + '.tmp', self.state_file)
+
+    def clear(self):
+        """
+        Method to remove the checkpoint
+        Parameters: None
+        Returns: None
+        """
+        shutil.rmtree(self.directory, ignore_errors=True)
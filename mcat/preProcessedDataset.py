@@ -1,12 +1,12 @@
 # Copyright 2021 VMware, Inc.
 # SPDX-License-Identifier: Apache-2.0
 
-import ast
-
 import numpy as np
 import pandas as pd
 import tensorflow as tf
 
+import utils
+
 
 class PreProcessedDataset:
     def __init__(self, vocab_size=1000, no_tokens=512, max_pull_length=100):
@@ -44,16 +44,9 @@ class PreProcessedDataset:
         self.full_dataset = self.full_dataset[
             ['Number', 'Thread', 'Constructive', 'Inclusive', 'Title', 'User', 'Body', 'Comments', 'Review_Comments']]
 
-        def stringToDict(string):
-            string = ast.literal_eval(string)
-            for i in range(len(string)):
-                string[i] = ast.literal_eval(string[i])
-            return string
-
-        # Convert all json strings to dictionaries
-        self.full_dataset['Comments'] = self.full_dataset['Comments'].apply(lambda comment: stringToDict(comment))
-        self.full_dataset['Review_Comments'] = self.full_dataset['Review_Comments'].apply(
-            lambda comment: stringToDict(comment))
+        # Convert all json strings to dictionaries, JSON Lines datasets already hold dictionaries
+        if not utils.is_jsonl(dataset_filename):
+            utils.decode_comment_columns(self.full_dataset, nested=True)
 
     def encodeData(self):
         """
@@ -65,93 +58,114 @@ class PreProcessedDataset:
         for utterances in all_utterances:
             self.all_encoded_utterances.append(self.encode(utterances))
         # Cap pull length to max
-        drop_indexes = []
-        for i in range(len(self.all_encoded_utterances)):
-            if len(self.all_encoded_utterances[i]) > 100:
-                drop_indexes.append(i)
-        drop_indexes.reverse()
-        for idx in drop_indexes:
-            self.all_encoded_utterances = self.all_encoded_utterances[:idx] + self.all_encoded_utterances[idx + 1:]
-            self.all_users = self.all_users[:idx] + self.all_users[idx + 1:]
-            self.results['Constructive'] = self.results['Constructive'][:idx] + self.results['Constructive'][idx + 1:]
-            self.results['Inclusive'] = self.results['Inclusive'][:idx] + self.results['Inclusive'][idx + 1:]
+        keep = [len(encoded_utterances) <= self.max_pull_length for encoded_utterances in self.all_encoded_utterances]
+        self.all_encoded_utterances = [pull for pull, kept in zip(self.all_encoded_utterances, keep) if kept]
+        self.all_users = [users for users, kept in zip(self.all_users, keep) if kept]
+        for outcome in self.results:
+            self.results[outcome] = [result for result, kept in zip(self.results[outcome], keep) if kept]
+        print("Dropped {} of {} pulls longer than {} utterances".format(keep.count(False), len(keep),
+                                                                       self.max_pull_length))
         self.curr_max_length = max([len(x) for x in self.all_encoded_utterances])
 
     def getRoleAgnosticMatrix(self, outcome=None, padPull=True):
         """
         Get matrix observation and results for ML task outcome = Inclusive, Constructive, or None -> both
         """
-
-        obs = []
-        for i in range(len(self.all_encoded_utterances)):
-            def pad(inp):
-                padding = [0] * self.no_tokens
-                while len(inp) < self.curr_max_length:
-                    inp = np.vstack([inp, padding.copy()])
-                return inp
-
-            # Pad to maximum pull length
-            if padPull:
-                obs.append(np.array(pad(self.all_encoded_utterances[i])))
-            else:
-                obs.append(tf.convert_to_tensor(np.array(self.all_encoded_utterances[i])))
+        # Pad to maximum pull length by writing every pull into one zero filled tensor
+        if padPull:
+            obs = np.zeros((len(self.all_encoded_utterances), self.curr_max_length, self.no_tokens), dtype=np.int32)
+            for i, encoded_utterances in enumerate(self.all_encoded_utterances):
+                obs[i, :len(encoded_utterances)] = encoded_utterances
+        else:
+            obs = [tf.convert_to_tensor(np.array(encoded_utterances))
+                   for encoded_utterances in self.all_encoded_utterances]
         res = self.getRes(outcome)
         return obs, res
 
     def getRoleMatrix(self, outcome=None, padPull=True):
         """
         Get stacked matrix observation and results for ML task
+        Utterances of the pull author are in the first layer, those of reviewers in the second
         """
         # Check if results must be padded to same length for each pull
         if padPull:
-            # Author and reviwer layers
-            layer_writer = []
-            layer_reviewer = []
-
+            obs = np.zeros((len(self.all_encoded_utterances), self.curr_max_length, self.no_tokens, 2), dtype=np.int32)
             for i in range(len(self.all_encoded_utterances)):
-                writer_comments = []
-                reviewer_comments = []
-                writer = self.all_users[i][0]
-
-                for j in range(len(self.all_encoded_utterances[i])):
-                    # Check if author or reviewer
-                    if self.all_users[i][j] == writer:
-                        writer_comments.append(self.all_encoded_utterances[i][j])
-                        reviewer_comments.append(np.zeros(self.no_tokens))
-                    else:
-                        reviewer_comments.append(self.all_encoded_utterances[i][j])
-                        writer_comments.append(np.zeros(self.no_tokens))
-                    padding = [0] * self.no_tokens
-
-                    # Pad both reviewer and writer layers
-                    while len(writer_comments) < self.curr_max_length:
-                        writer_comments.append(padding.copy())
-                        reviewer_comments.append(padding.copy())
-                    layer_writer.append(np.array(writer_comments))
-                    layer_reviewer.append(np.array(reviewer_comments))
-
-            # Stack reviwer and author matrices
-            obs = np.stack((layer_writer, layer_reviewer), axis=3)
-            res = self.getRes(outcome)
-            return obs, res
+                self._writeRoleLayers(obs[i], i)
         else:
             obs = []
             for i in range(len(self.all_encoded_utterances)):
-                writer_comments = []
-                reviewer_comments = []
-                writer = self.all_users[i][0]
-
-                for j in range(len(self.all_encoded_utterances[i])):
-                    if self.all_users[i][j] == writer:
-                        writer_comments.append(self.all_encoded_utterances[i][j])
-                        reviewer_comments.append(np.zeros(self.no_tokens))
-                    else:
-                        reviewer_comments.append(self.all_encoded_utterances[i][j])
-                        writer_comments.append(np.zeros(self.no_tokens))
                 # Stack individual layers since their lenghts are not equal
-                obs.append(tf.convert_to_tensor(np.stack((writer_comments, reviewer_comments), axis=2)))
-            res = self.getRes(outcome)
-            return obs, res
+                pull_obs = np.zeros((len(self.all_encoded_utterances[i]), self.no_tokens, 2), dtype=np.int32)
+                self._writeRoleLayers(pull_obs, i)
+                obs.append(tf.convert_to_tensor(pull_obs))
+        res = self.getRes(outcome)
+        return obs, res
+
+    def _writeRoleLayers(self, pull_obs, i):
+        """
+        Write the utterances of pull i into the author and reviewer layers of pull_obs
+        """
+        encoded_utterances = self.all_encoded_utterances[i]
+        writer = self.all_users[i][0]
+
+        # Check if author or reviewer
+        writer_mask = np.array([user == writer for user in self.all_users[i][:len(encoded_utterances)]], dtype=bool)
+        utterance_indexes = np.arange(len(encoded_utterances))
+        pull_obs[utterance_indexes[writer_mask], :, 0] = encoded_utterances[writer_mask]
+        pull_obs[utterance_indexes[~writer_mask], :, 1] = encoded_utterances[~writer_mask]
+
+    def getDataset(self, outcome, roleRelevant=False, indexes=None, batch_size=32, pad_length=None, shuffle=True):
+        """
+        Get a tf.data.Dataset streaming (observation, result) batches of pulls for ML task outcome = Inclusive or
+        Constructive. Pulls are bucketed by length and only padded to the longest pull of their batch, or to
+        pad_length if given. Observations are built when a batch is needed, so the padded matrix is never
+        materialized. The order of the pulls is shuffled on every pass over the dataset if shuffle is set.
+        """
+        if indexes is None:
+            indexes = list(range(len(self.all_encoded_utterances)))
+        results = self.getRes(outcome)
+
+        if roleRelevant:
+            observation_shape = (None, self.no_tokens, 2)
+        else:
+            observation_shape = (None, self.no_tokens)
+
+        dataset = tf.data.Dataset.from_generator(
+            lambda: self.generatePulls(indexes, results, roleRelevant, shuffle),
+            output_signature=(tf.TensorSpec(shape=observation_shape, dtype=tf.int32),
+                              tf.TensorSpec(shape=(), dtype=tf.float32)))
+
+        # Bucket boundaries double up to the longest pull
+        bucket_boundaries = []
+        boundary = 2
+        while boundary < self.curr_max_length:
+            bucket_boundaries.append(boundary)
+            boundary *= 2
+
+        padded_shapes = None
+        if pad_length is not None:
+            padded_shapes = ((pad_length,) + observation_shape[1:], ())
+        dataset = dataset.bucket_by_sequence_length(
+            element_length_func=lambda pull_obs, result: tf.shape(pull_obs)[0],
+            bucket_boundaries=bucket_boundaries, bucket_batch_sizes=[batch_size] * (len(bucket_boundaries) + 1),
+            padded_shapes=padded_shapes)
+        return dataset.prefetch(tf.data.AUTOTUNE)
+
+    def generatePulls(self, indexes, results, roleRelevant=False, shuffle=False):
+        """
+        Generate the (observation, result) pairs of the pulls at indexes, building each observation only when it is
+        needed. The indexes are permuted instead of shuffling the observations, so only one pull is held at a time.
+        """
+        if shuffle:
+            indexes = np.random.permutation(indexes)
+        for i in indexes:
+            if roleRelevant:
+                pull_obs = np.zeros((len(self.all_encoded_utterances[i]), self.no_tokens, 2), dtype=np.int32)
+                self._writeRoleLayers(pull_obs, i)
+            else:
+                pull_obs = self.all_encoded_utterances[i]
+            yield pull_obs, results[i]
 
     def getRes(self, outcome=None):
         """
@@ -170,32 +184,32 @@ class PreProcessedDataset:
 
     def loadDataset(self, filename):
         """
-        Load raw data from file
+        Load raw data from csv or JSON Lines file
         """
-        self.dataset = pd.read_csv(filename)
+        self.dataset = utils.read_export(filename)
         self.dataset_open = True
 
     def encode(self, utterances):
         """
-        Encode an utterance through the lookup dictionary
+        Encode the utterances of a pull through the lookup dictionary into an int32 array of shape
+        (number of utterances, no_tokens)
         """
-        encoded_utterances = []
-        for utterance in utterances:
-            obs = []
-            words = utterance.split(" ")
-            for word in words:
-                obs.append(self.codes.get(word, 2))
-                # Truncate to 512 tokens
-                if len(obs) > self.no_tokens - 1:
-                    break
-            # Indicate message end
-            if len(obs) < self.no_tokens:
-                obs.append(1)
-            # Pad to 512 tokens
-            while len(obs) < self.no_tokens:
-                obs.append(0)
-            encoded_utterances.append(np.array(obs))
-        return np.array(encoded_utterances)
+        # Truncate to no_tokens words, words past them are not split
+        utterance_words = [utterance.split(" ", self.no_tokens)[:self.no_tokens] for utterance in utterances]
+        lengths = np.array([len(words) for words in utterance_words], dtype=np.int64)
+
+        # Write the codes of all words of the pull at once, the rest stays 0 for padding
+        encoded_utterances = np.zeros((len(utterance_words), self.no_tokens), dtype=np.int32)
+        rows = np.repeat(np.arange(len(utterance_words)), lengths)
+        columns = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        all_words = [word for words in utterance_words for word in words]
+        encoded_utterances[rows, columns] = np.fromiter(map(self.codes.get, all_words, [2] * len(all_words)),
+                                                        dtype=np.int32, count=len(all_words))
+
+        # Indicate message end
+        ended = lengths < self.no_tokens
+        encoded_utterances[ended, lengths[ended]] = 1
+        return encoded_utterances
 
     def _setupEncode(self):
         """
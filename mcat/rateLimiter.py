@@ -0,0 +1,139 @@
+# Copyright 2021 VMware, Inc.
+# SPDX-License-Identifier: Apache-2.0
+
+import datetime
+import threading
+import time
+
+
+class RateLimiter:
+    def __init__(self, min_interval=1.0):
+        """
+        Constructor creates a token bucket shared by every thread sending requests with the same access token.
+        The bucket holds the rate limit points left in the current window. It is refilled from the
+        X-RateLimit-Remaining and X-RateLimit-Reset headers or the rateLimit object returned by GitHub. Requests are
+        sent min_interval seconds apart to avoid the secondary rate limits while the bucket covers their cost, and
+        wait for the window to reset once it does not.
+        Parameters: min_interval - minimum number of seconds between the start of two requests
+        """
+        self.min_interval = min_interval
+        self.remaining = None
+        self.reset_time = None
+        self.next_request_time = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, cost=1):
+        """
+        Method to block the calling thread until a request may be sent
+        Parameters: cost - expected rate limit points of the request
+        Returns: None
+        """
+        with self.lock:
+            current_time = time.time()
+            start_time = max(current_time, self.next_request_time)
+            interval = self.min_interval
+
+            if self.remaining is not None and self.reset_time is not None and self.reset_time > start_time:
+                if self.remaining < max(cost, 1):
+                    # Budget exhausted, nothing can be sent until the window resets
+                    print('waiting {} seconds for the rate limit to reset'.format(self.reset_time - current_time))
+                    start_time = self.reset_time
+                    self.remaining = None
+                else:
+                    self.remaining -= cost
+
+            self.next_request_time = start_time + interval
+
+        wait_time_seconds = start_time - current_time
+        if wait_time_seconds > 0:
+            time.sleep(wait_time_seconds)
+
+    def available_points(self):
+        """
+        Method to get the points left in the current window
+        Parameters: None
+        Returns: number of points, infinity if the budget is unknown or the window has reset
+        """
+        with self.lock:
+            if self.remaining is None or self.reset_time is None or self.reset_time <= time.time():
+                return float('inf')
+            return self.remaining
+
+    def update_from_headers(self, headers):
+        """
+        Method to refill the bucket from the rate limit headers of a response
+        Parameters: headers - response headers
+        Returns: None
+        """
+        try:
+            remaining = int(headers.get('X-RateLimit-Remaining'))
+            reset_time = float(headers.get('X-RateLimit-Reset'))
+        except (TypeError, ValueError):
+            return
+
+        with self.lock:
+            self.remaining = remaining
+            self.reset_time = reset_time
+
+    def update_from_rate_limit(self, rate_limit):
+        """
+        Method to refill the bucket from the rateLimit object of a graphql response
+        Parameters: rate_limit - dictionary with remaining and resetAt keys
+        Returns: None
+        """
+        try:
+            remaining = int(rate_limit['remaining'])
+            reset_time = datetime.datetime.strptime(rate_limit['resetAt'], '%Y-%m-%dT%H:%M:%SZ').replace(
+                tzinfo=datetime.timezone.utc).timestamp()
+        except (KeyError, TypeError, ValueError):
+            return
+
+        with self.lock:
+            self.remaining = remaining
+            self.reset_time = reset_time
+
+
+class TokenPool:
+    def __init__(self, access_tokens, min_interval=1.0):
+        """
+        Constructor creates a rate limiter for every access token, so the budget and reset time of each token
+        are tracked separately.
+        Parameters:
+            access_tokens - list of access tokens
+            min_interval - minimum number of seconds between the start of two requests with the same token
+        """
+        if not access_tokens:
+            raise ValueError('At least one access token is required')
+        self.rate_limiters = {token: RateLimiter(min_interval) for token in access_tokens}
+
+    def acquire(self, cost=1):
+        """
+        Method to pick the token with the most remaining budget and block until a request may be sent with it.
+        Tokens with the same budget are used in turn.
+        Parameters: cost - expected rate limit points of the request
+        Returns: access token to send the request with
+        """
+        token = max(self.rate_limiters, key=lambda candidate: (self.rate_limiters[candidate].available_points(),
+                                                               -self.rate_limiters[candidate].next_request_time))
+        self.rate_limiters[token].acquire(cost)
+        return token
+
+    def update_from_headers(self, token, headers):
+        """
+        Method to refill the budget of a token from the rate limit headers of a response
+        Parameters:
+            token - access token the request was sent with
+            headers - response headers
+        Returns: None
+        """
+        self.rate_limiters[token].update_from_headers(headers)
+
+    def update_from_rate_limit(self, token, rate_limit):
+        """
+        Method to refill the budget of a token from the rateLimit object of a graphql response
+        Parameters:
+            token - access token the request was sent with
+            rate_limit - dictionary with remaining and resetAt keys
+        Returns: None
+        """
+        self.rate_limiters[token].update_from_rate_limit(rate_limit)
@@ -0,0 +1,91 @@
+# Copyright 2021 VMware, Inc.
+# SPDX-License-Identifier: Apache-2.0
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+
+RECORD = 'record'
+REPLAY = 'replay'
+
+
+class CacheMissError(LookupError, requests.RequestException):
+    """
+    Exception raised in replay mode for a query without a cached response, the extraction of the repo fails like it
+    does for a failed request
+    """
+
+
+class ResponseCache:
+    def __init__(self, directory, mode=RECORD, ttl=None):
+        """
+        Constructor sets the directory graphql responses are cached in.
+        In record mode cached responses are returned and missing ones are fetched and stored. In replay mode only
+        cached responses are used, so extraction can run without network access.
+        Parameters:
+            directory - cache directory
+            mode - RECORD or REPLAY
+            ttl - number of seconds a cached response stays valid, never expires if None
+        """
+        if mode not in (RECORD, REPLAY):
+            raise ValueError('Cache mode must be either {} or {}'.format(RECORD, REPLAY))
+        self.directory = directory
+        self.mode = mode
+        self.ttl = ttl
+
+    def key(self, query):
+        """
+        Method to compute the cache key of a query.
+        The page size is left out as it does not change which pull requests follow a cursor.
+        Parameters: query - dict of graphql query and variables
+        Returns: sha256 hex digest of the query text and variables
+        """
+        variables = {name: value for name, value in query.get('variables', {}).items() if name != 'pageSize'}
+        text = json.dumps({'query': query.get('query'), 'variables': variables}, sort_keys=True)
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        """
+        Method to get the file a response is cached in
+        Parameters: key - cache key
+        Returns: file path
+        """
+        return os.path.join(self.directory, key[:2], key + '.json')
+
+    def get(self, query):
+        """
+        Method to get the cached response of a query
+        Parameters: query - dict of graphql query and variables
+        Returns: dictionary of the json response, None if it is not cached or expired in record mode
+        Raises: CacheMissError if it is not cached or expired in replay mode
+        """
+        file = self.path(self.key(query))
+        if os.path.exists(file) and (self.ttl is None or time.time() - os.path.getmtime(file) <= self.ttl):
+            with open(file) as cache_file:
+                return json.load(cache_file)
+
+        if self.mode == REPLAY:
+            raise CacheMissError('No cached response for query with variables {}'.format(query.get('variables')))
+        return None
+
+    def put(self, query, response_json):
+        """
+        Method to cache the response of a query. Replayed responses do not spend any rate limit points, so the
+        rateLimit object is not stored.
+        Parameters:
+            query - dict of graphql query and variables
+            response_json - dictionary of the json response
+        Returns: None
+        """
+        file = self.path(self.key(query))
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+
+        data = {name: value for name, value in response_json.get('data', {}).items() if name != 'rateLimit'}
+        temporary_file = '{}.{}.tmp'.format(file, threading.get_ident())
+        with open(temporary_file, 'w') as cache_file:
+            json.dump({'data': data}, cache_file)
+        os.replace(temporary_file, file)
@@ -26,7 +26,8 @@ def save_model(model, name, version):
     os.chdir("../../")
     print("Model saved in {}/{}; {}/{}".format(model_path, version, model_path, tar_file_name))
 
-def run(annotated_filename, dataset_filename, outcome, encoding_type, model_type, padding, save_name, model_ver):
+def run(annotated_filename, dataset_filename, outcome, encoding_type, model_type, padding, save_name, model_ver,
+        stream=False):
     # Setup dataset
     data = PreProcessedDataset()
     data.setupPreProcess(annotated_filename, dataset_filename)
@@ -38,20 +39,23 @@ def run(annotated_filename, dataset_filename, outcome, encoding_type, model_type
     else:
         model = BaseCNN()
 
-    # Get data for training
-    if encoding_type == 'role':
-        obs, res = data.getRoleMatrix(outcome, padding)
-        model.makeModel2D(obs[0].shape)
+    if stream:
+        scores = run_streamed(data, model, outcome, encoding_type, model_type, padding)
     else:
-        obs, res = data.getRoleAgnosticMatrix(outcome, padding)
-        model.makeModel(obs[0].shape)
-
-    # Train model
-    train_obs, test_obs, train_res, test_res = train_test_split(obs, res, stratify=res, test_size=0.2)
-    model.trainModel(train_obs, train_res)
-
-    # Score model
-    scores = model.scoreModel(test_obs, test_res)
+        # Get data for training
+        if encoding_type == 'role':
+            obs, res = data.getRoleMatrix(outcome, padding)
+            model.makeModel2D(obs[0].shape)
+        else:
+            obs, res = data.getRoleAgnosticMatrix(outcome, padding)
+            model.makeModel(obs[0].shape)
+
+        # Train model
+        train_obs, test_obs, train_res, test_res = train_test_split(obs, res, stratify=res, test_size=0.2)
+        model.trainModel(train_obs, train_res)
+
+        # Score model
+        scores = model.scoreModel(test_obs, test_res)
     
     # Save model
     if save_name is not None and len(save_name) > 0:
@@ -59,6 +63,26 @@ def run(annotated_filename, dataset_filename, outcome, encoding_type, model_type
 
     return scores
 
+def run_streamed(data, model, outcome, encoding_type, model_type, padding):
+    # Split pulls, their observations are only built batch by batch by the tf.data pipeline
+    res = data.getRes(outcome)
+    train_indexes, test_indexes = train_test_split(list(range(len(res))), stratify=res, test_size=0.2)
+
+    # The CNN flattens its input so every batch is padded to the longest pull, LSTM batches only to their longest pull
+    pad_length = data.curr_max_length if model_type != 'LSTM' or padding else None
+    role_relevant = encoding_type == 'role'
+    if role_relevant:
+        model.makeModel2D((pad_length, data.no_tokens, 2))
+    else:
+        model.makeModel((pad_length, data.no_tokens))
+
+    # Train model
+    model.trainModel(data.getDataset(outcome, role_relevant, train_indexes, pad_length=pad_length))
+
+    # Score model
+    return model.scoreModel(data.getDataset(outcome, role_relevant, test_indexes, pad_length=pad_length,
+                                            shuffle=False))
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -74,6 +98,9 @@ if __name__ == "__main__":
     parser.add_argument('-roleRelevant', action='store_true', default=False,
                         help='Encoding method differentiates b/w conversation roles')
     parser.add_argument('-pad', action='store_true', default=False, help='Pad total length of each pull')
+    parser.add_argument('-stream', action='store_true', default=False,
+                        help='Stream pulls through a tf.data pipeline bucketed by length instead of building the '
+                             'whole observation matrix')
 
     args = parser.parse_args()
 
@@ -86,13 +113,13 @@ if __name__ == "__main__":
 
     if args.outcome != 'Both':
         run_res = run(args.annotated_filename, args.dataset_filename, args.outcome, encodingType,
-                      args.model, args.pad, args.save, args.save_version)
+                      args.model, args.pad, args.save, args.save_version, args.stream)
         print(run_res)
     else:
         run_res_constructive = run(args.annotated_filename, args.dataset_filename, 'Constructive', encodingType,
-                                   args.model, args.pad, args.save, args.save_version)
+                                   args.model, args.pad, args.save, args.save_version, args.stream)
         print("Constructive: {}".format(run_res_constructive))
 
         run_res_inclusive = run(args.annotated_filename, args.dataset_filename, 'Inclusive', encodingType,
-                                args.model, args.pad, args.save, args.save_version)
+                                args.model, args.pad, args.save, args.save_version, args.stream)
         print("Inclusvie: {}".format(run_res_inclusive))
@@ -1,10 +1,20 @@
 import ast
+import json
 import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import pandas as pd
 
 EXPORTS_DIR = "exports"
+CSV_EXTENSION = ".csv"
+JSONL_EXTENSION = ".jsonl"
+CSV_FORMAT = "csv"
+JSONL_FORMAT = "jsonl"
+EXPORT_EXTENSIONS = {CSV_FORMAT: CSV_EXTENSION, JSONL_FORMAT: JSONL_EXTENSION}
+COMMENT_COLUMNS = ["Comments", "Review_Comments"]
+DECODE_CHUNK_SIZE = 10000
+WATERMARKS_FILE = "watermarks.json"
 
 
 def export_to_cvs(export_df: pd.DataFrame, name):
@@ -12,8 +22,7 @@ def export_to_cvs(export_df: pd.DataFrame, name):
     Export DataFrame into csv file with given name
     """
 
-    if not os.path.exists(EXPORTS_DIR):
-        os.mkdir(EXPORTS_DIR)
+    os.makedirs(EXPORTS_DIR, exist_ok=True)
 
     file = os.path.join(EXPORTS_DIR, name)
 
@@ -21,22 +30,221 @@ def export_to_cvs(export_df: pd.DataFrame, name):
     print("Output file: ", os.path.abspath(file))
 
 
-def construct_file_name(name, component_a, component_b, separator="_"):
+def export_chunks_to_cvs(chunks, name):
+    """
+    Export an iterable of DataFrames into a single csv file with given name.
+    Every chunk is appended as soon as it is produced, the file only replaces an existing export once every chunk is
+    written. Returns the number of rows written.
+    """
+    os.makedirs(EXPORTS_DIR, exist_ok=True)
+
+    file = os.path.join(EXPORTS_DIR, name)
+    count = 0
+    with open(file + ".tmp", "w", newline="") as export_file:
+        for chunk in chunks:
+            chunk.to_csv(export_file, index=False, header=count == 0)
+            count += len(chunk)
+    os.replace(file + ".tmp", file)
+    print("Output file: ", os.path.abspath(file))
+    return count
+
+
+def export_to_jsonl(rows, name):
+    """
+    Export an iterable of dictionaries into a JSON Lines file with given name.
+    Rows are written as they are produced, the file only replaces an existing export once every row is written.
+    Returns the number of rows written.
+    """
+    os.makedirs(EXPORTS_DIR, exist_ok=True)
+
+    file = os.path.join(EXPORTS_DIR, name)
+    count = 0
+    with open(file + ".tmp", "w") as export_file:
+        for row in rows:
+            export_file.write(json.dumps(row) + "\n")
+            count += 1
+    os.replace(file + ".tmp", file)
+    print("Output file: ", os.path.abspath(file))
+    return count
+
+
+def export_data_frame(export_df: pd.DataFrame, name):
+    """
+    Export DataFrame into a csv or JSON Lines file depending on the extension of the given name.
+    JSON Lines exports keep comments and reviews as lists of objects, so they are read back without parsing strings.
+    """
+    if not is_jsonl(name):
+        export_to_cvs(export_df, name)
+        return
+
+    # Missing values are written as null rather than NaN which is not valid JSON
+    rows = export_df.astype(object).where(export_df.notna(), None).to_dict("records")
+    export_to_jsonl(rows, name)
+
+
+def is_jsonl(file):
+    """
+    Check whether a file is a JSON Lines export
+    """
+    return Path(file).suffix == JSONL_EXTENSION
+
+
+def read_jsonl(file):
+    """
+    Read a JSON Lines export into a DataFrame, nested lists and objects are kept as they are
+    """
+    with open(file) as jsonl_file:
+        return pd.DataFrame([json.loads(line) for line in jsonl_file if line.strip()])
+
+
+def read_export(file):
+    """
+    Read a csv or JSON Lines export into a DataFrame without converting comment columns
+    """
+    if is_jsonl(file):
+        return read_jsonl(file)
+    return pd.read_csv(file)
+
+
+def read_raw_data(file, nested=False, workers=None):
+    """
+    Read raw data exported by githubDataExtraction.
+    Comments and Review_Comments of JSON Lines exports are already lists of dictionaries, those of legacy csv exports
+    are decoded with decode_comment_columns.
+    """
+    raw_data = read_export(file)
+    if not is_jsonl(file):
+        decode_comment_columns(raw_data, nested=nested, workers=workers)
+    return raw_data
+
+
+def read_raw_data_chunks(file, chunk_size, nested=False, workers=None):
+    """
+    Read raw data exported by githubDataExtraction in DataFrames of at most chunk_size rows,
+    so memory does not grow with the size of the export. Comment columns are converted like in read_raw_data.
+    """
+    if is_jsonl(file):
+        with open(file) as jsonl_file:
+            rows = []
+            for line in jsonl_file:
+                if line.strip():
+                    rows.append(json.loads(line))
+                if len(rows) == chunk_size:
+                    yield pd.DataFrame(rows)
+                    rows = []
+            if rows:
+                yield pd.DataFrame(rows)
+        return
+
+    for chunk in pd.read_csv(file, chunksize=chunk_size):
+        yield decode_comment_columns(chunk, nested=nested, workers=workers)
+
+
+def decode_comment_columns(data: pd.DataFrame, columns=None, nested=False, workers=None,
+                           chunk_size=DECODE_CHUNK_SIZE):
+    """
+    Decode stringified comment columns of a legacy csv export in place.
+    Columns are split in chunks of chunk_size strings decoded across workers processes, all available cpus by default.
+    Set nested for exports storing every comment as a string of its own.
+    """
+    for column in columns or COMMENT_COLUMNS:
+        strings = data[column].tolist()
+        chunks = [strings[start:start + chunk_size] for start in range(0, len(strings), chunk_size)]
+
+        if len(chunks) > 1 and workers != 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                decoded_chunks = list(executor.map(_decode_chunk, chunks, [nested] * len(chunks)))
+        else:
+            decoded_chunks = [_decode_chunk(chunk, nested) for chunk in chunks]
+
+        data[column] = pd.Series([value for chunk in decoded_chunks for value in chunk], index=data.index,
+                                 dtype=object)
+    return data
+
+
+def _decode_chunk(strings, nested):
+    """
+    Decode a chunk of strings, runs in worker processes of decode_comment_columns
+    """
+    if nested:
+        return [[decode_string(string) for string in decode_string(value)] for value in strings]
+    return [decode_string(value) for value in strings]
+
+
+def decode_string(string):
+    """
+    Convert a stringified list or dictionary. JSON is parsed first as it is much faster,
+    python literals with single quotes or None fall back to ast.literal_eval.
+    """
+    try:
+        return json.loads(string)
+    except (TypeError, ValueError):
+        return ast.literal_eval(string)
+
+
+def merge_with_export(update_df: pd.DataFrame, name, key="Number"):
+    """
+    Merge rows of update_df into the existing export with given name.
+    Rows of the export sharing a key with update_df are replaced. Returns the merged DataFrame sorted by key.
+    """
+    file = os.path.join(EXPORTS_DIR, name)
+    if not os.path.exists(file):
+        return update_df
+
+    export_df = read_export(file)
+    if update_df.empty:
+        return export_df
+
+    export_df = export_df[~export_df[key].isin(update_df[key])]
+    merged_df = pd.concat([export_df, update_df], ignore_index=True)
+    return merged_df.sort_values(by=key)
+
+
+def read_watermarks():
+    """
+    Read the watermarks of incremental extraction, a dictionary of export file name to last updatedAt seen
+    """
+    file = os.path.join(EXPORTS_DIR, WATERMARKS_FILE)
+    if not os.path.exists(file):
+        return {}
+
+    with open(file) as watermarks_file:
+        return json.load(watermarks_file)
+
+
+def write_watermarks(watermarks):
+    """
+    Write the watermarks of incremental extraction. The file is replaced atomically.
+    """
+    os.makedirs(EXPORTS_DIR, exist_ok=True)
+
+    file = os.path.join(EXPORTS_DIR, WATERMARKS_FILE)
+    with open(file + ".tmp", "w") as watermarks_file:
+        json.dump(watermarks, watermarks_file, indent=2, sort_keys=True)
+    os.replace(file + ".tmp", file)
+
+
+def construct_file_name(name, component_a, component_b, separator="_", extension=CSV_EXTENSION):
     """
     Construct output file name if `name` is not provided explicitly.
     File output name is constructed based on component_a, component_b and separator input parameters :
-    <component_a><separator><component_b>.csv
+    <component_a><separator><component_b><extension>
     """
     if name:
         _, file_extension = os.path.splitext(name)
         if not file_extension:
-            name = name + ".csv"
+            name = name + extension
         return name
     else:
-        return "{}{}{}.csv".format(Path(component_a).stem, separator, component_b)
+        return "{}{}{}{}".format(Path(component_a).stem, separator, component_b, extension)
 
 
 def string_to_dict(string):
     """Function to convert json strings to dictionary"""
-    return ast.literal_eval(string)
+    return decode_string(string)
+
+
+def string_to_dict_list(string):
+    """Function to convert a string of a list of json strings to a list of dictionaries"""
+    return _decode_chunk([string], nested=True)[0]
 
@@ -35,6 +35,30 @@ class TestCommentAnalysis(unittest.TestCase):
         result = analyzer.analyzeComment("```This patch has blocks```, ```This is second block```")
         self.assertEqual({'code block test': 0, 'Sentiment': 1.0, 'Code Blocks': 2}, result)
 
+    def test_analyzeComments(self):
+        analyzer = commentAnalysis.CommentAnalyzer(['test'])
+        analyzer.vader_sentiment = self.sentiment_analyzer
+        result = analyzer.analyzeComments(["This is a test PR", "```block```", "This is a test PR"])
+        self.assertEqual(['test', 'Sentiment', 'Code Blocks'], list(result.columns))
+        self.assertEqual([1, 0, 1], list(result['test']))
+        self.assertEqual([1.0, 1.0, 1.0], list(result['Sentiment']))
+        self.assertEqual([0, 1, 0], list(result['Code Blocks']))
+        self.assertEqual(2, self.sentiment_analyzer.polarity_scores.call_count)
+
+    def test_analyzeComments_with_no_comments(self):
+        analyzer = commentAnalysis.CommentAnalyzer(['test'])
+        result = analyzer.analyzeComments([])
+        self.assertEqual(['test', 'Sentiment', 'Code Blocks'], list(result.columns))
+        self.assertEqual(0, len(result))
+
+    def test_getSentiment_evicts_least_recently_used_scores(self):
+        analyzer = commentAnalysis.CommentAnalyzer(['test'], sentiment_cache_size=2)
+        analyzer.vader_sentiment = self.sentiment_analyzer
+        for comment in ["one", "two", "one", "three", "one", "two"]:
+            analyzer.getSentiment(comment)
+        self.assertEqual(["one", "two", "three", "two"],
+                         [call[0][0] for call in self.sentiment_analyzer.polarity_scores.call_args_list])
+
     def test_preProcess(self):
         analyzer = commentAnalysis.CommentAnalyzer(['preProcess test'])
         result = analyzer.preProcess("THIS is a TEST COMMENT")
@@ -45,6 +69,21 @@ class TestCommentAnalysis(unittest.TestCase):
         result = analyzer.countWords("This is a test comment")
         self.assertEqual({'count words test': 0}, result)
 
+    def test_countWords_matches_words_next_to_punctuation(self):
+        analyzer = commentAnalysis.CommentAnalyzer(['test', 'lgtm', 'thank you', 'c++'])
+        result = analyzer.countWords("lgtm, thank you! (test) testing c++ test")
+        self.assertEqual({'test': 2, 'lgtm': 1, 'thank you': 1, 'c++': 1}, result)
+
+    def test_countWordsSparse(self):
+        analyzer = commentAnalysis.CommentAnalyzer(['test', 'lgtm'])
+        self.assertEqual({'test': 1}, analyzer.countWordsSparse("this is a test."))
+        self.assertEqual({}, commentAnalysis.CommentAnalyzer([]).countWordsSparse("this is a test."))
+
+    def test_changeWords(self):
+        analyzer = commentAnalysis.CommentAnalyzer(['test'])
+        analyzer.changeWords(['comment'])
+        self.assertEqual({'comment': 1}, analyzer.countWords("this is a test comment"))
+
     def test_getSentiment(self):
         analyzer = commentAnalysis.CommentAnalyzer(['sentiment test'])
         result = analyzer.getSentiment("This is a very good PR")
@@ -55,6 +94,22 @@ class TestCommentAnalysis(unittest.TestCase):
         result = analyzer.getCodeBlockCount("```This comment has code block``` ``` this is the 2nd code block```")
         self.assertEqual(2, result)
 
+    @unittest.mock.patch("nltk.download")
+    @unittest.mock.patch("nltk.data.find")
+    def test_loadNltkResource_does_not_download_local_resource(self, mock_find, mock_download):
+        commentAnalysis.loadNltkResource("sentiment/vader_lexicon.zip", "vader_lexicon", directory="test-directory")
+        mock_find.assert_called_once_with("sentiment/vader_lexicon.zip")
+        mock_download.assert_not_called()
+        self.assertIn("test-directory", commentAnalysis.nltk.data.path)
+        commentAnalysis.nltk.data.path.remove("test-directory")
+
+    @unittest.mock.patch("nltk.download")
+    @unittest.mock.patch("nltk.data.find", side_effect=LookupError)
+    def test_loadNltkResource_downloads_missing_resource(self, mock_find, mock_download):
+        commentAnalysis.loadNltkResource("sentiment/vader_lexicon.zip", "vader_lexicon", directory="test-directory")
+        mock_download.assert_called_once_with("vader_lexicon", download_dir="test-directory")
+        commentAnalysis.nltk.data.path.remove("test-directory")
+
 
 if __name__ == '__main__':
     unittest.main()
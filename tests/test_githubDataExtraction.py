@@ -1,16 +1,17 @@
 # Copyright 2021 VMware, Inc.
 # SPDX-License-Identifier: Apache-2.0
 
-import datetime
 import json
 import os
+import tempfile
+import time
 import unittest
 import unittest.mock
 
 import pandas as pd
 import requests
 
-from mcat import githubDataExtraction
+from mcat import githubDataExtraction, pageCheckpoint, responseCache
 
 
 class TestGitHubDataExtraction(unittest.TestCase):
@@ -21,6 +22,7 @@ class TestGitHubDataExtraction(unittest.TestCase):
         self.test_repo = "test-repo"
         self.extractor = githubDataExtraction.GithubDataExtractor(self.test_access_token, self.test_organization)
         self.extractor.wait_time = 1
+        self.extractor.backoff_base = 0.001
         self.directory_path = os.path.dirname(os.path.realpath(__file__))
 
     def test_get_all_repos_returns_list_of_repos(self):
@@ -86,7 +88,7 @@ class TestGitHubDataExtraction(unittest.TestCase):
         self.extractor.get_all_pull_requests(self.test_repo, reaction_flag=False)
 
         self.assertEqual(1, self.extractor.run_queries.call_count)
-        self.extractor.run_queries.assert_called_with(query=test_queries_and_variables)
+        self.extractor.run_queries.assert_called_with(query=test_queries_and_variables, checkpoint=None)
 
     def test_get_all_pull_requests_with_reactions_calls_run_queries_with_correct_arguments(self):
         with open("{}/resources/pr_raw_data_example_one.json".format(self.directory_path)) as raw_data_file:
@@ -105,7 +107,7 @@ class TestGitHubDataExtraction(unittest.TestCase):
         self.extractor.get_all_pull_requests(self.test_repo, reaction_flag=True)
 
         self.assertEqual(1, self.extractor.run_queries.call_count)
-        self.extractor.run_queries.assert_called_with(query=test_queries_and_variables)
+        self.extractor.run_queries.assert_called_with(query=test_queries_and_variables, checkpoint=None)
 
     def test_get_all_pull_requests_returns_empty_dataframe_when_pull_requests_does_not_exist(self):
         pr_list = []
@@ -126,6 +128,145 @@ class TestGitHubDataExtraction(unittest.TestCase):
         self.assertEqual(1, actual["Number"].iloc[0])
         self.assertEqual(10, actual["Number"].iloc[1])
 
+    def test_get_all_pull_requests_updated_since_orders_by_updated_at_and_filters_old_pulls(self):
+        with open("{}/resources/pr_raw_data_example_one.json".format(self.directory_path)) as raw_data_file_one:
+            pr_one = json.load(raw_data_file_one)
+        with open("{}/resources/pr_raw_data_example_two.json".format(self.directory_path)) as raw_data_file_two:
+            pr_two = json.load(raw_data_file_two)
+        pr_one["updatedAt"] = "2022-01-02T00:00:00Z"
+        pr_two["updatedAt"] = "2021-12-31T00:00:00Z"
+
+        self.extractor.run_queries = unittest.mock.MagicMock(return_value=[pr_one, pr_two])
+        actual = self.extractor.get_all_pull_requests(self.test_repo, updated_since="2022-01-01T00:00:00Z")
+
+        query = self.extractor.run_queries.call_args[1]["query"]
+        until = self.extractor.run_queries.call_args[1]["until"]
+        self.assertEqual({"field": "UPDATED_AT", "direction": "DESC"}, query["variables"]["orderBy"])
+        self.assertFalse(until([pr_one]))
+        self.assertTrue(until([pr_one, pr_two]))
+        self.assertEqual([1], actual["Number"].tolist())
+
+    def test_fetch_remaining_comments_pages_truncated_connections_in_batches(self):
+        pr_one = {
+            "number": 1,
+            "comments": {"totalCount": 3, "nodes": [{"body": "comment-one"}],
+                         "pageInfo": {"endCursor": "comments-cursor-one", "hasNextPage": True}},
+            "reviews": {"totalCount": 1, "nodes": [{"body": "review-one"}],
+                        "pageInfo": {"endCursor": "reviews-cursor-one", "hasNextPage": False}}
+        }
+        pr_two = {
+            "number": 2,
+            "comments": {"totalCount": 0, "nodes": [],
+                         "pageInfo": {"endCursor": None, "hasNextPage": False}},
+            "reviews": {"totalCount": 2, "nodes": [{"body": "review-one"}],
+                        "pageInfo": {"endCursor": "reviews-cursor-one", "hasNextPage": True}}
+        }
+
+        responses = [
+            {"data": {"repository": {
+                "pr0": {"comments": {"nodes": [{"body": "comment-two"}],
+                                     "pageInfo": {"endCursor": "comments-cursor-two", "hasNextPage": True}}},
+                "pr1": {"reviews": {"nodes": [{"body": "review-two"}],
+                                    "pageInfo": {"endCursor": "reviews-cursor-two", "hasNextPage": False}}}}}},
+            {"data": {"repository": {
+                "pr0": {"comments": {"nodes": [{"body": "comment-three"}],
+                                     "pageInfo": {"endCursor": "comments-cursor-three", "hasNextPage": False}}}}}}
+        ]
+        self.extractor.execute_query = unittest.mock.MagicMock(side_effect=responses)
+
+        self.extractor.fetch_remaining_comments(self.test_repo, [pr_one, pr_two])
+
+        self.assertEqual(2, self.extractor.execute_query.call_count)
+        first_query = self.extractor.execute_query.call_args_list[0][0][0]
+        self.assertEqual({"owner": self.test_organization, "repo": self.test_repo, "number0": 1,
+                          "cursor0": "comments-cursor-one", "number1": 2, "cursor1": "reviews-cursor-one"},
+                         first_query["variables"])
+        self.assertIn("pr1: pullRequest(number: $number1)", first_query["query"])
+        self.assertIn("fragment ReviewFields on PullRequestReview", first_query["query"])
+        self.assertEqual(["comment-one", "comment-two", "comment-three"],
+                         [comment["body"] for comment in pr_one["comments"]["nodes"]])
+        self.assertEqual(["review-one", "review-two"], [review["body"] for review in pr_two["reviews"]["nodes"]])
+
+    def test_fetch_remaining_comments_does_not_query_complete_pull_requests(self):
+        with open("{}/resources/pr_raw_data_example_one.json".format(self.directory_path)) as raw_data_file:
+            pr_one = json.load(raw_data_file)
+        self.extractor.execute_query = unittest.mock.MagicMock()
+
+        self.extractor.fetch_remaining_comments(self.test_repo, [pr_one])
+        self.extractor.execute_query.assert_not_called()
+
+    def test_build_remaining_comments_query_uses_reaction_fragment_when_extracting_reactions(self):
+        self.extractor.reaction_flag = True
+        pr = {"number": 1, "comments": {"pageInfo": {"endCursor": "test-cursor", "hasNextPage": True}}}
+
+        actual = self.extractor.build_remaining_comments_query(self.test_repo, [(pr, "comments")])
+        self.assertIn(self.extractor.fragment_comment_fields_with_reactions, actual["query"])
+        self.assertNotIn("fragment ReviewFields", actual["query"])
+
+    def test_get_first_pages_fetches_several_repos_with_one_query(self):
+        response = {"data": {
+            "r0": {"pullRequests": {"nodes": [{"number": 1}],
+                                    "pageInfo": {"endCursor": "cursor-one", "hasNextPage": False}}},
+            "r1": None,
+            "r2": {"pullRequests": {"nodes": [{"number": 2}],
+                                    "pageInfo": {"endCursor": "cursor-two", "hasNextPage": True}}}}}
+        self.extractor.execute_query = unittest.mock.MagicMock(return_value=response)
+
+        actual = self.extractor.get_first_pages(["repo-one", "missing-repo", "repo-two"])
+
+        self.extractor.execute_query.assert_called_once()
+        query = self.extractor.execute_query.call_args[0][0]
+        self.assertEqual({"owner": self.test_organization, "pageSize": 100, "repo0": "repo-one",
+                          "repo1": "missing-repo", "repo2": "repo-two"}, query["variables"])
+        self.assertIn("r2: repository(owner: $owner, name: $repo2)", query["query"])
+        self.assertIn("$pageSize: Int = 100", query["query"])
+        self.assertIn("fragment PullRequestFields on PullRequest", query["query"])
+        self.assertEqual({"repo-one": ([{"number": 1}], {"endCursor": "cursor-one", "hasNextPage": False}),
+                          "repo-two": ([{"number": 2}], {"endCursor": "cursor-two", "hasNextPage": True})}, actual)
+
+    def test_get_first_pages_keeps_query_within_node_limit(self):
+        self.extractor.execute_query = unittest.mock.MagicMock(return_value={"data": {}})
+
+        self.extractor.get_first_pages(["repo-{}".format(index) for index in range(24)])
+        self.assertEqual(100, self.extractor.execute_query.call_args[0][0]["variables"]["pageSize"])
+
+        self.extractor.get_first_pages(["repo-{}".format(index) for index in range(40)])
+        self.assertEqual(62, self.extractor.execute_query.call_args[0][0]["variables"]["pageSize"])
+
+        self.extractor.get_first_pages(["repo-one"], reaction_flag=True)
+        self.assertEqual(49, self.extractor.execute_query.call_args[0][0]["variables"]["pageSize"])
+
+    def test_retrieve_and_export_batched_repos_caps_batch_size_to_node_limit(self):
+        self.extractor.get_first_pages = unittest.mock.MagicMock(return_value={})
+        self.extractor.retrieve_and_export_all_repos = unittest.mock.MagicMock(return_value=[])
+        repos = ["repo-{}".format(index) for index in range(30)]
+
+        self.extractor.retrieve_and_export_batched_repos(repos, False, self.test_organization, batch_size=30)
+
+        self.assertEqual([unittest.mock.call(repos[:24], False), unittest.mock.call(repos[24:], False)],
+                         self.extractor.get_first_pages.call_args_list)
+
+    @unittest.mock.patch("mcat.utils.export_to_cvs")
+    def test_retrieve_and_export_batched_repos_paginates_only_large_repos(self, mock_export):
+        small_page = ([], {"endCursor": None, "hasNextPage": False})
+        large_page = ([], {"endCursor": "cursor", "hasNextPage": True})
+        self.extractor.get_first_pages = unittest.mock.MagicMock(side_effect=[
+            {"repo-one": small_page, "repo-two": large_page}, {"repo-three": small_page}])
+        self.extractor.retrieve_and_export_all_repos = unittest.mock.MagicMock(return_value=[])
+
+        failed = self.extractor.retrieve_and_export_batched_repos(
+            ["repo-one", "repo-two", "repo-three"], False, self.test_organization, batch_size=2, workers=3)
+
+        self.assertEqual([], failed)
+        self.assertEqual([unittest.mock.call(["repo-one", "repo-two"], False),
+                          unittest.mock.call(["repo-three"], False)], self.extractor.get_first_pages.call_args_list)
+        self.assertEqual(["{}_repo-one.csv".format(self.test_organization),
+                          "{}_repo-three.csv".format(self.test_organization)],
+                         [call[0][1] for call in mock_export.call_args_list])
+        self.extractor.retrieve_and_export_all_repos.assert_called_once_with(
+            repos=["repo-two"], reactions_flag=False, organization=self.test_organization, workers=3,
+            export_format="csv")
+
     def test_get_pull_features_without_reactions(self):
         self.extractor.reaction_flag = False
 
@@ -281,7 +422,7 @@ class TestGitHubDataExtraction(unittest.TestCase):
         actual = self.extractor.list_of_comments(comments)
         self.assertFalse(actual)
 
-    @unittest.mock.patch("requests.post")
+    @unittest.mock.patch("requests.Session.post")
     def test_run_queries_returns_list_of_data(self, mock_request_post):
         test_query = """ { test query } """
         self.extractor.query_repos = test_query
@@ -315,10 +456,11 @@ class TestGitHubDataExtraction(unittest.TestCase):
         mock_request_post.assert_called_once_with(
             url='https://api.github.com/graphql',
             json=test_queries_and_variables,
-            headers={'Authorization': 'bearer ' + self.test_access_token}
+            headers={'Authorization': 'bearer ' + self.test_access_token},
+            timeout=githubDataExtraction.REQUEST_TIMEOUT
         )
 
-    @unittest.mock.patch("requests.post")
+    @unittest.mock.patch("requests.Session.post")
     def test_run_queries_throws_an_exception_if_request_status_code_is_not_200_502_503_403_413_429(self,
                                                                                                    mock_request_post):
         test_status_code = 401
@@ -338,7 +480,7 @@ class TestGitHubDataExtraction(unittest.TestCase):
 
         self.assertEqual(expected, error.exception.args[0])
 
-    @unittest.mock.patch("requests.post")
+    @unittest.mock.patch("requests.Session.post")
     def test_run_queries_makes_multiple_post_calls_when_next_page_is_available(self, mock_request_post):
         self.extractor.query_repos = """ { test query } """
 
@@ -391,7 +533,7 @@ class TestGitHubDataExtraction(unittest.TestCase):
         self.extractor.run_queries(test_query_and_variables)
         self.assertEqual(2, mock_request_post.call_count)
 
-    @unittest.mock.patch("requests.post")
+    @unittest.mock.patch("requests.Session.post")
     def test_run_queries_retries_when_status_code_is_502_503_403_413_429(self, mock_request_post):
         self.extractor.query_repos = """ { test query } """
 
@@ -431,9 +573,11 @@ class TestGitHubDataExtraction(unittest.TestCase):
         self.assertEqual(6, mock_request_post.call_count)
         self.assertEqual(1, len(actual))
 
-    @unittest.mock.patch("datetime.datetime", wraps=datetime.datetime)
-    @unittest.mock.patch("requests.post")
-    def test_run_queries_retries_after_waiting_when_rate_limit_exceeds(self, mock_request_post, mock_datetime):
+    @unittest.mock.patch("time.sleep")
+    @unittest.mock.patch("time.time", return_value=1000.0)
+    @unittest.mock.patch("requests.Session.post")
+    def test_run_queries_retries_after_waiting_when_rate_limit_exceeds(self, mock_request_post, mock_time,
+                                                                       mock_sleep):
         self.extractor.query_repos = """ { test query } """
 
         test_query_and_variables = {
@@ -457,21 +601,325 @@ class TestGitHubDataExtraction(unittest.TestCase):
             }
         }
 
-        mock_datetime.now.return_value = datetime.datetime(2022, 1, 1, 0, 0, 0)
-        mock_datetime.fromtimestamp.return_value = datetime.datetime(2022, 1, 1, 0, 0, 1)
-
         mock_response = [unittest.mock.MagicMock(), unittest.mock.MagicMock()]
         mock_response[0].status_code = 200
-        mock_response[0].headers.get = unittest.mock.MagicMock(return_value="0")
+        mock_response[0].headers = {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "1060"}
         mock_response[1].status_code = 200
+        mock_response[1].headers = {}
         mock_response[1].json.return_value = data_with_hasNextPage
         mock_request_post.side_effect = mock_response
 
         actual = self.extractor.run_queries(test_query_and_variables)
         self.assertEqual(2, mock_request_post.call_count)
         self.assertEqual(1, len(actual))
+        # The retry waits until X-RateLimit-Reset
+        mock_sleep.assert_called_once_with(60.0)
+
+    @unittest.mock.patch("requests.Session.post")
+    def test_run_queries_paces_next_page_from_reported_cost(self, mock_request_post):
+        self.extractor.query_repos = """ { test query } """
+
+        data_with_rate_limit = {
+            "data": {
+                "organization": {
+                    "repositories": {
+                        "pageInfo": {
+                            "endCursor": "test-end-cursor",
+                            "hasNextPage": False
+                        },
+                        "nodes": [{"test": "test-value"}]
+                    }
+                },
+                "rateLimit": {
+                    "cost": 7,
+                    "remaining": 4000,
+                    "resetAt": "2022-01-01T00:00:00Z"
+                }
+            }
+        }
+
+        mock_request_post.return_value.json.return_value = data_with_rate_limit
+        mock_request_post.return_value.status_code = 200
+        self.extractor.token_pool = unittest.mock.MagicMock()
+        self.extractor.token_pool.acquire.return_value = self.test_access_token
+
+        self.extractor.run_queries({"query": self.extractor.query_repos, "variables": {}})
+        self.extractor.run_queries({"query": self.extractor.query_repos, "variables": {}})
+
+        self.extractor.token_pool.update_from_rate_limit.assert_called_with(
+            self.test_access_token, data_with_rate_limit["data"]["rateLimit"])
+        self.assertEqual([unittest.mock.call(cost=1), unittest.mock.call(cost=7)],
+                         self.extractor.token_pool.acquire.call_args_list)
+
+    @unittest.mock.patch("requests.Session.post")
+    def test_run_queries_shrinks_page_size_after_server_errors_and_grows_it_after_successes(self,
+                                                                                          mock_request_post):
+        test_query = """ query ($pageSize: Int = 100) { test query } """
+
+        def page(has_next_page):
+            response = unittest.mock.MagicMock()
+            response.status_code = 200
+            response.json.return_value = {
+                "data": {
+                    "repository": {
+                        "pullRequests": {
+                            "pageInfo": {
+                                "endCursor": "test-end-cursor",
+                                "hasNextPage": has_next_page
+                            },
+                            "nodes": [{"test": "test-value"}]
+                        }
+                    }
+                }
+            }
+            return response
+
+        server_error = unittest.mock.MagicMock()
+        server_error.status_code = 502
+        responses = iter([server_error, server_error, page(True), page(True), page(True), page(False)])
+
+        page_sizes = []
+
+        def post(url, json, headers, timeout):
+            page_sizes.append(json["variables"]["pageSize"])
+            return next(responses)
+
+        mock_request_post.side_effect = post
+
+        actual = self.extractor.run_queries({"query": test_query, "variables": {}})
+        self.assertEqual([100, 50, 25, 25, 25, 50], page_sizes)
+        self.assertEqual(4, len(actual))
+
+    @unittest.mock.patch("requests.Session.post")
+    def test_run_queries_does_not_grow_page_size_back_into_node_limit(self, mock_request_post):
+        test_query = """ query ($pageSize: Int = 100) { test query } """
+
+        def page(has_next_page):
+            response = unittest.mock.MagicMock()
+            response.status_code = 200
+            response.json.return_value = {"data": {"repository": {"pullRequests": {
+                "pageInfo": {"endCursor": "test-end-cursor", "hasNextPage": has_next_page},
+                "nodes": [{"test": "test-value"}]}}}}
+            return response
+
+        node_limit_exceeded = unittest.mock.MagicMock()
+        node_limit_exceeded.status_code = 200
+        node_limit_exceeded.json.return_value = {"errors": [{"type": "MAX_NODE_LIMIT_EXCEEDED",
+                                                             "message": "exceeds the maximum limit"}]}
+        responses = iter([node_limit_exceeded] + [page(True)] * 5 + [page(False)])
+        page_sizes = []
+
+        def post(url, json, headers, timeout):
+            page_sizes.append(json["variables"]["pageSize"])
+            return next(responses)
+
+        mock_request_post.side_effect = post
+
+        actual = self.extractor.run_queries({"query": test_query, "variables": {}})
+        self.assertEqual([100] + [50] * 6, page_sizes)
+        self.assertEqual(6, len(actual))
+
+    def test_run_queries_starts_pull_request_pages_within_node_limit(self):
+        self.extractor.reaction_flag = True
+        self.extractor.execute_query = unittest.mock.MagicMock(return_value={"data": {"repository": {
+            "pullRequests": {"pageInfo": {"endCursor": None, "hasNextPage": False}, "nodes": []}}}})
+
+        self.extractor.run_queries({"query": """ query ($pageSize: Int = 100) { test query } """, "variables": {}})
+        self.assertEqual(49, self.extractor.execute_query.call_args[0][0]["variables"]["pageSize"])
+
+    @unittest.mock.patch("requests.Session.post")
+    def test_execute_query_raises_graphql_errors_without_data(self, mock_request_post):
+        response = unittest.mock.MagicMock()
+        response.status_code = 200
+        response.json.return_value = {"errors": [{"type": "NOT_FOUND", "message": "Could not resolve"}]}
+        mock_request_post.return_value = response
+
+        with self.assertRaisesRegex(githubDataExtraction.GraphQLError, "Could not resolve"):
+            self.extractor.execute_query({"query": "{ test query }", "variables": {}})
+        self.assertEqual(1, mock_request_post.call_count)
+
+    @unittest.mock.patch("requests.Session.post")
+    def test_execute_query_shrinks_page_size_when_node_limit_exceeded(self, mock_request_post):
+        node_limit_exceeded = unittest.mock.MagicMock()
+        node_limit_exceeded.status_code = 200
+        node_limit_exceeded.json.return_value = {"errors": [{"type": "MAX_NODE_LIMIT_EXCEEDED",
+                                                             "message": "exceeds the maximum limit"}]}
+        success = unittest.mock.MagicMock()
+        success.status_code = 200
+        success.json.return_value = {"data": {"test": "test-value"}}
+        page_sizes = []
+
+        def post(url, json, headers, timeout):
+            page_sizes.append(json["variables"]["pageSize"])
+            return node_limit_exceeded if len(page_sizes) == 1 else success
+
+        mock_request_post.side_effect = post
+
+        actual = self.extractor.execute_query({"query": "{ test query }", "variables": {"pageSize": 100}})
+        self.assertEqual([100, 50], page_sizes)
+        self.assertEqual({"data": {"test": "test-value"}}, actual)
+
+    @unittest.mock.patch("time.sleep")
+    def test_wait_before_retry_backs_off_exponentially(self, mock_sleep):
+        self.extractor.backoff_base = 1
+        self.extractor.max_backoff = 60
+
+        with unittest.mock.patch("random.uniform", side_effect=lambda low, high: high) as mock_uniform:
+            for retries in range(8):
+                self.extractor.wait_before_retry(retries)
+
+        self.assertEqual([1, 2, 4, 8, 16, 32, 60, 60], [call[0][1] for call in mock_uniform.call_args_list])
+        self.assertEqual(8, mock_sleep.call_count)
+
+    @unittest.mock.patch("requests.Session.post")
+    def test_run_queries_sends_request_with_token_picked_from_pool(self, mock_request_post):
+        test_query = """ { test query } """
+        extractor = githubDataExtraction.GithubDataExtractor(["test-token-one", "test-token-two"],
+                                                             self.test_organization)
+        extractor.query_repos = test_query
+        extractor.token_pool.update_from_headers("test-token-one", {"X-RateLimit-Remaining": "10",
+                                                                    "X-RateLimit-Reset": "9999999999"})
+
+        data = {
+            "data": {
+                "organization": {
+                    "repositories": {
+                        "pageInfo": {
+                            "endCursor": "test-end-cursor",
+                            "hasNextPage": False
+                        },
+                        "nodes": [{"test": "test-value"}]
+                    }
+                }
+            }
+        }
+
+        mock_request_post.return_value.json.return_value = data
+        mock_request_post.return_value.status_code = 200
+        mock_request_post.return_value.headers = {"X-RateLimit-Remaining": "4000", "X-RateLimit-Reset": "9999999999"}
+
+        extractor.run_queries({"query": test_query, "variables": {}})
+
+        self.assertEqual({"Authorization": "bearer test-token-two"}, mock_request_post.call_args[1]["headers"])
+        self.assertEqual(4000, extractor.token_pool.rate_limiters["test-token-two"].remaining)
+        self.assertEqual(10, extractor.token_pool.rate_limiters["test-token-one"].remaining)
+
+    @unittest.mock.patch("requests.Session.post")
+    def test_run_queries_records_responses_and_replays_them_without_requests(self, mock_request_post):
+        self.extractor.query_repos = """ { test query } """
+
+        data = {
+            "data": {
+                "organization": {
+                    "repositories": {
+                        "pageInfo": {
+                            "endCursor": "test-end-cursor",
+                            "hasNextPage": False
+                        },
+                        "nodes": [{"test": "test-value"}]
+                    }
+                }
+            }
+        }
+
+        mock_request_post.return_value.json.return_value = data
+        mock_request_post.return_value.status_code = 200
+
+        with tempfile.TemporaryDirectory() as directory:
+            self.extractor.response_cache = responseCache.ResponseCache(directory)
+            recorded = self.extractor.run_queries({"query": self.extractor.query_repos, "variables": {}})
+
+            self.extractor.response_cache = responseCache.ResponseCache(directory, mode=responseCache.REPLAY)
+            replayed = self.extractor.run_queries({"query": self.extractor.query_repos, "variables": {}})
+
+        self.assertEqual(1, mock_request_post.call_count)
+        self.assertEqual(recorded, replayed)
+
+    @unittest.mock.patch("requests.Session.post")
+    def test_run_queries_stops_when_until_returns_true(self, mock_request_post):
+        self.extractor.query_repos = """ { test query } """
+
+        test_query_and_variables = {
+            "query": self.extractor.query_repos,
+            "variables": {"key": "value"}
+        }
+
+        data_with_hasNextPage = {
+            "data": {
+                "organization": {
+                    "repositories": {
+                        "pageInfo": {
+                            "endCursor": "test-end-cursor",
+                            "hasNextPage": True
+                        },
+                        "nodes": [{"test": "test-value"}]
+                    }
+                }
+            }
+        }
+
+        mock_request_post.return_value.json.return_value = data_with_hasNextPage
+        mock_request_post.return_value.status_code = 200
+
+        actual = self.extractor.run_queries(test_query_and_variables, until=lambda nodes: True)
+        self.assertEqual(1, mock_request_post.call_count)
+        self.assertEqual([{"test": "test-value"}], actual)
+
+    @unittest.mock.patch("requests.Session.post")
+    def test_run_queries_commits_pages_to_checkpoint_and_resumes_from_it(self, mock_request_post):
+        self.extractor.query_repos = """ { test query } """
+
+        data_with_hasNextPage = {
+            "data": {
+                "organization": {
+                    "repositories": {
+                        "pageInfo": {
+                            "endCursor": "test-end-cursor-one",
+                            "hasNextPage": True
+                        },
+                        "nodes": [{"test": "test-value-one"}]
+                    }
+                }
+            }
+        }
+
+        data_without_hasNextPage = {
+            "data": {
+                "organization": {
+                    "repositories": {
+                        "pageInfo": {
+                            "endCursor": "test-end-cursor-two",
+                            "hasNextPage": False
+                        },
+                        "nodes": [{"test": "test-value-two"}]
+                    }
+                }
+            }
+        }
+
+        mock_response = [unittest.mock.MagicMock(), unittest.mock.MagicMock(), unittest.mock.MagicMock()]
+        mock_response[0].status_code = 200
+        mock_response[0].json.return_value = data_with_hasNextPage
+        mock_response[1].status_code = 401
+        mock_response[1].json.return_value = {}
+        mock_response[2].status_code = 200
+        mock_response[2].json.return_value = data_without_hasNextPage
+        mock_request_post.side_effect = mock_response
+
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = pageCheckpoint.PageCheckpoint(directory)
+            with self.assertRaises(requests.HTTPError):
+                self.extractor.run_queries({"query": self.extractor.query_repos, "variables": {}},
+                                           checkpoint=checkpoint)
 
-    @unittest.mock.patch("requests.post")
+            actual = self.extractor.run_queries({"query": self.extractor.query_repos, "variables": {}},
+                                                checkpoint=checkpoint)
+
+        # The first page is read from the checkpoint instead of being requested again
+        self.assertEqual(3, mock_request_post.call_count)
+        self.assertEqual([{"test": "test-value-one"}, {"test": "test-value-two"}], actual)
+
+    @unittest.mock.patch("requests.Session.post")
     def test_run_queries_retries_multiple_times(self, mock_request_post):
         test_query = """ { test query } """
         self.extractor.query_repos = test_query
@@ -538,6 +986,160 @@ class TestGitHubDataExtraction(unittest.TestCase):
         mock_construct_file.assert_called_once_with(None, self.test_organization, self.test_repo)
         mock_export.assert_called_once_with(test_data_frame, test_file_name)
 
+    @unittest.mock.patch("mcat.utils.export_to_jsonl")
+    def test_retrieve_and_export_pull_request_data_exports_jsonl_format(self, mock_export):
+        test_data_frame = pd.DataFrame({"Number": [1, 2], "Comments": [[{"Body": "test"}], []],
+                                        "Closed_At": ["2022-01-01T00:00:00Z", None]})
+        self.extractor.get_all_pull_requests = unittest.mock.MagicMock(return_value=test_data_frame)
+
+        self.extractor.retrieve_and_export_pull_request_data(repo=self.test_repo, reactions_flag=False, name=None,
+                                                             organization=self.test_organization,
+                                                             export_format="jsonl")
+
+        mock_export.assert_called_once_with(
+            [{"Number": 1, "Comments": [{"Body": "test"}], "Closed_At": "2022-01-01T00:00:00Z"},
+             {"Number": 2, "Comments": [], "Closed_At": None}],
+            "{}_{}.jsonl".format(self.test_organization, self.test_repo))
+
+    @unittest.mock.patch("mcat.utils.write_watermarks")
+    @unittest.mock.patch("mcat.utils.read_watermarks")
+    @unittest.mock.patch("mcat.utils.merge_with_export")
+    @unittest.mock.patch("mcat.utils.export_to_cvs")
+    @unittest.mock.patch("os.path.exists", return_value=True)
+    def test_retrieve_and_export_pull_request_data_incremental_merges_updates(self, mock_exists, mock_export,
+                                                                             mock_merge, mock_read_watermarks,
+                                                                             mock_write_watermarks):
+        test_file_name = "{}_{}.csv".format(self.test_organization, self.test_repo)
+        test_watermark = "2022-01-01T00:00:00Z"
+        update_df = pd.DataFrame({"Number": [2], "Updated_At": ["2022-01-02T00:00:00Z"]})
+        merged_df = pd.DataFrame({"Number": [1, 2], "Updated_At": ["2021-12-01T00:00:00Z", "2022-01-02T00:00:00Z"]})
+
+        mock_read_watermarks.return_value = {test_file_name: test_watermark}
+        mock_merge.return_value = merged_df
+        mock_checkpoint = unittest.mock.MagicMock()
+        self.extractor.get_checkpoint = unittest.mock.MagicMock(return_value=mock_checkpoint)
+        self.extractor.get_all_pull_requests = unittest.mock.MagicMock(return_value=update_df)
+
+        self.extractor.retrieve_and_export_pull_request_data(repo=self.test_repo, reactions_flag=False, name=None,
+                                                             organization=self.test_organization, incremental=True)
+
+        self.extractor.get_all_pull_requests.assert_called_once_with(
+            self.test_repo, False, updated_since=test_watermark, checkpoint=mock_checkpoint)
+        mock_checkpoint.clear.assert_called()
+        mock_merge.assert_called_once_with(update_df, test_file_name, key="Number")
+        mock_export.assert_called_once_with(merged_df, test_file_name)
+        mock_write_watermarks.assert_called_once_with({test_file_name: "2022-01-02T00:00:00Z"})
+
+    @unittest.mock.patch("mcat.utils.write_watermarks")
+    @unittest.mock.patch("mcat.utils.read_watermarks", return_value={})
+    @unittest.mock.patch("mcat.utils.export_to_cvs")
+    @unittest.mock.patch("time.gmtime", return_value=time.struct_time((2022, 1, 3, 12, 0, 0, 0, 3, 0)))
+    def test_retrieve_and_export_pull_request_data_incremental_watermark_does_not_pass_start(
+            self, mock_gmtime, mock_export, mock_read_watermarks, mock_write_watermarks):
+        test_file_name = "{}_{}.csv".format(self.test_organization, self.test_repo)
+        update_df = pd.DataFrame({"Number": [1, 2], "Updated_At": ["2022-01-02T00:00:00Z", "2022-01-04T00:00:00Z"]})
+        self.extractor.get_checkpoint = unittest.mock.MagicMock()
+        self.extractor.get_all_pull_requests = unittest.mock.MagicMock(return_value=update_df)
+
+        self.extractor.retrieve_and_export_pull_request_data(repo=self.test_repo, reactions_flag=False, name=None,
+                                                             organization=self.test_organization, incremental=True)
+
+        mock_write_watermarks.assert_called_once_with({test_file_name: "2022-01-03T12:00:00Z"})
+
+    @unittest.mock.patch("mcat.utils.export_to_jsonl")
+    def test_retrieve_and_export_pull_request_data_stream_exports_jsonl(self, mock_export):
+        with open("{}/resources/pr_raw_data_example_one.json".format(self.directory_path)) as raw_data_file:
+            pr_one = json.load(raw_data_file)
+
+        mock_export.side_effect = lambda rows, name: list(rows)
+        self.extractor.iterate_pages = unittest.mock.MagicMock(return_value=iter([[pr_one], [pr_one]]))
+
+        self.extractor.retrieve_and_export_pull_request_data(repo=self.test_repo, reactions_flag=False, name=None,
+                                                             organization=self.test_organization, stream=True)
+
+        test_file_name = "{}_{}.jsonl".format(self.test_organization, self.test_repo)
+        self.assertEqual(test_file_name, mock_export.call_args[0][1])
+        self.assertEqual(1, self.extractor.iterate_pages.call_count)
+
+    def test_stream_pull_requests_yields_pull_features_page_by_page(self):
+        with open("{}/resources/pr_raw_data_example_one.json".format(self.directory_path)) as raw_data_file_one:
+            pr_one = json.load(raw_data_file_one)
+        with open("{}/resources/pr_raw_data_example_two.json".format(self.directory_path)) as raw_data_file_two:
+            pr_two = json.load(raw_data_file_two)
+
+        self.extractor.iterate_pages = unittest.mock.MagicMock(return_value=iter([[pr_one], [pr_two]]))
+
+        actual = list(self.extractor.stream_pull_requests(self.test_repo))
+        self.assertEqual([self.extractor.get_pull_features(pr_one), self.extractor.get_pull_features(pr_two)],
+                         actual)
+
+    def test_create_session_requests_gzip_and_pools_connections(self):
+        session = githubDataExtraction.create_session(pool_size=4)
+
+        self.assertEqual("gzip", session.headers["Accept-Encoding"])
+        self.assertEqual(4, session.get_adapter(githubDataExtraction.GRAPHQL_URL)._pool_maxsize)
+
+    def test_retrieve_and_export_all_repos_exports_every_repo(self):
+        self.extractor.retrieve_and_export_pull_request_data = unittest.mock.MagicMock()
+        repos = ["repo_one", "repo_two", "repo_three"]
+
+        with tempfile.TemporaryDirectory() as directory, unittest.mock.patch("mcat.utils.EXPORTS_DIR", directory):
+            failed = self.extractor.retrieve_and_export_all_repos(repos=repos, reactions_flag=False,
+                                                                  organization=self.test_organization, workers=2)
+            self.assertEqual(set(), self.extractor.get_completed_exports())
+
+        self.assertEqual([], failed)
+        self.assertEqual(3, self.extractor.retrieve_and_export_pull_request_data.call_count)
+        exported_repos = [call[1]["repo"] for call in
+                          self.extractor.retrieve_and_export_pull_request_data.call_args_list]
+        self.assertCountEqual(repos, exported_repos)
+
+    def test_retrieve_and_export_all_repos_returns_failed_repos(self):
+        def export(repo, **kwargs):
+            if repo == "repo_two":
+                raise requests.HTTPError("test-error")
+
+        self.extractor.retrieve_and_export_pull_request_data = unittest.mock.MagicMock(side_effect=export)
+
+        with tempfile.TemporaryDirectory() as directory, unittest.mock.patch("mcat.utils.EXPORTS_DIR", directory):
+            failed = self.extractor.retrieve_and_export_all_repos(repos=["repo_one", "repo_two"], reactions_flag=False,
+                                                                  organization=self.test_organization, workers=2)
+        self.assertEqual(["repo_two"], failed)
+
+    def test_retrieve_and_export_all_repos_reports_replay_cache_misses_as_failed(self):
+        self.extractor.get_all_pull_requests = unittest.mock.MagicMock(side_effect=lambda repo, *args, **kwargs: (
+            self.extractor.execute_query({"query": "{ test query }", "variables": {"repo": repo}})))
+
+        with tempfile.TemporaryDirectory() as directory, unittest.mock.patch("mcat.utils.EXPORTS_DIR", directory):
+            self.extractor.response_cache = responseCache.ResponseCache(directory, mode=responseCache.REPLAY)
+            failed = self.extractor.retrieve_and_export_all_repos(repos=["repo_one"], reactions_flag=False,
+                                                                  organization=self.test_organization)
+        self.assertEqual(["repo_one"], failed)
+
+    def test_retrieve_and_export_all_repos_resume_skips_completed_repos(self):
+        def export(repo, **kwargs):
+            if repo == "repo_two" and not kwargs["resume"]:
+                raise requests.HTTPError("test-error")
+
+        self.extractor.retrieve_and_export_pull_request_data = unittest.mock.MagicMock(side_effect=export)
+        repos = ["repo_one", "repo_two", "repo_three"]
+
+        with tempfile.TemporaryDirectory() as directory, unittest.mock.patch("mcat.utils.EXPORTS_DIR", directory):
+            failed = self.extractor.retrieve_and_export_all_repos(repos=repos, reactions_flag=False,
+                                                                  organization=self.test_organization, workers=2)
+            self.assertEqual(["repo_two"], failed)
+            self.assertEqual({"test-org_repo_one.csv", "test-org_repo_three.csv"},
+                             self.extractor.get_completed_exports())
+
+            self.extractor.retrieve_and_export_pull_request_data.reset_mock()
+            failed = self.extractor.retrieve_and_export_all_repos(repos=repos, reactions_flag=False,
+                                                                  organization=self.test_organization, resume=True)
+            self.assertEqual([], failed)
+            self.extractor.retrieve_and_export_pull_request_data.assert_called_once_with(
+                repo="repo_two", reactions_flag=False, name=None, organization=self.test_organization,
+                incremental=False, resume=True, stream=False, export_format="csv")
+            self.assertEqual(set(), self.extractor.get_completed_exports())
+
 
 if __name__ == '__main__':
     unittest.main()
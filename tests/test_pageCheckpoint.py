@@ -0,0 +1,52 @@
+# Copyright 2021 VMware, Inc.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import tempfile
+import unittest
+
+from mcat import pageCheckpoint
+
+
+class TestPageCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.checkpoint = pageCheckpoint.PageCheckpoint(os.path.join(self.directory.name, "test-checkpoint"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_load_returns_none_without_commits(self):
+        self.assertIsNone(self.checkpoint.load())
+        self.assertEqual([], list(self.checkpoint.read_pages()))
+
+    def test_commit_stores_pages_and_last_cursor(self):
+        self.checkpoint.commit([{"number": 1}], "test-cursor-one", True)
+        self.checkpoint.commit([{"number": 2}, {"number": 3}], "test-cursor-two", False)
+
+        state = self.checkpoint.load()
+        self.assertEqual("test-cursor-two", state["cursor"])
+        self.assertFalse(state["has_next_page"])
+        self.assertEqual([[{"number": 1}], [{"number": 2}, {"number": 3}]], list(self.checkpoint.read_pages()))
+
+    def test_read_pages_ignores_data_written_after_last_commit(self):
+        self.checkpoint.commit([{"number": 1}], "test-cursor-one", True)
+        with open(self.checkpoint.nodes_file, "a") as file:
+            file.write('[{"number": 2}')
+
+        self.assertEqual([[{"number": 1}]], list(self.checkpoint.read_pages()))
+
+        self.checkpoint.commit([{"number": 3}], "test-cursor-two", False)
+        self.assertEqual([[{"number": 1}], [{"number": 3}]], list(self.checkpoint.read_pages()))
+
+    def test_clear_removes_checkpoint(self):
+        self.checkpoint.commit([{"number": 1}], "test-cursor-one", True)
+        self.checkpoint.clear()
+
+        self.assertIsNone(self.checkpoint.load())
+        self.assertFalse(os.path.exists(self.checkpoint.directory))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+# Copyright 2021 VMware, Inc.
+# SPDX-License-Identifier: Apache-2.0
+
+import importlib
+import importlib.util
+import os
+import sys
+import unittest
+
+import numpy as np
+
+# preProcessedDataset imports its sibling modules the way run.py does, from the mcat directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "mcat"))
+
+
+@unittest.skipIf(importlib.util.find_spec("tensorflow") is None, "tensorflow is not installed")
+class TestPreProcessedDataset(unittest.TestCase):
+
+    def setUp(self):
+        preProcessedDataset = importlib.import_module("mcat.preProcessedDataset")
+        self.data = preProcessedDataset.PreProcessedDataset(no_tokens=4)
+        self.data.all_encoded_utterances = [np.full((length, 4), length, dtype=np.int32) for length in [1, 3, 2]]
+        self.data.all_users = [["author"], ["author", "reviewer", "author"], ["author", "reviewer"]]
+        self.results = [0.0, 1.0, 0.0]
+
+    def test_generatePulls_keeps_order_without_shuffle(self):
+        pulls = list(self.data.generatePulls([2, 0, 1], self.results))
+
+        self.assertEqual([2, 1, 3], [len(pull_obs) for pull_obs, result in pulls])
+        self.assertEqual([0.0, 0.0, 1.0], [result for pull_obs, result in pulls])
+
+    def test_generatePulls_shuffles_every_pull_once(self):
+        np.random.seed(0)
+        pulls = list(self.data.generatePulls([0, 1, 2], self.results, shuffle=True))
+
+        self.assertCountEqual([1, 2, 3], [len(pull_obs) for pull_obs, result in pulls])
+        self.assertCountEqual(self.results, [result for pull_obs, result in pulls])
+
+    def test_generatePulls_builds_role_layers(self):
+        pull_obs, result = next(self.data.generatePulls([1], self.results, roleRelevant=True))
+
+        self.assertEqual((3, 4, 2), pull_obs.shape)
+        self.assertEqual([3, 0, 3], list(pull_obs[:, 0, 0]))
+        self.assertEqual([0, 3, 0], list(pull_obs[:, 0, 1]))
+        self.assertEqual(1.0, result)
+
+
+if __name__ == '__main__':
+    unittest.main()
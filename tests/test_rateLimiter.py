@@ -0,0 +1,107 @@
+# Copyright 2021 VMware, Inc.
+# SPDX-License-Identifier: Apache-2.0
+
+import unittest
+import unittest.mock
+
+from mcat import rateLimiter
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.limiter = rateLimiter.RateLimiter(min_interval=1.0)
+
+    @unittest.mock.patch("time.sleep")
+    @unittest.mock.patch("time.time", return_value=1000.0)
+    def test_acquire_does_not_wait_for_first_request(self, mock_time, mock_sleep):
+        self.limiter.acquire()
+        mock_sleep.assert_not_called()
+
+    @unittest.mock.patch("time.sleep")
+    @unittest.mock.patch("time.time", return_value=1000.0)
+    def test_acquire_spaces_requests_by_min_interval(self, mock_time, mock_sleep):
+        self.limiter.acquire()
+        self.limiter.acquire()
+        mock_sleep.assert_called_once_with(1.0)
+
+    @unittest.mock.patch("time.sleep")
+    @unittest.mock.patch("time.time", return_value=1000.0)
+    def test_acquire_waits_until_reset_when_budget_is_exhausted(self, mock_time, mock_sleep):
+        self.limiter.update_from_headers({'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '1060'})
+        self.limiter.acquire()
+        mock_sleep.assert_called_once_with(60.0)
+
+    @unittest.mock.patch("time.sleep")
+    @unittest.mock.patch("time.time", return_value=1000.0)
+    def test_acquire_sends_requests_within_budget_at_min_interval(self, mock_time, mock_sleep):
+        self.limiter.update_from_headers({'X-RateLimit-Remaining': '5000', 'X-RateLimit-Reset': '4600'})
+        for _ in range(30):
+            self.limiter.acquire(cost=100)
+
+        # The clock is frozen, so every request starting min_interval after the previous one waits a second longer
+        self.assertEqual([unittest.mock.call(float(index)) for index in range(1, 30)], mock_sleep.call_args_list)
+        self.assertEqual(2000, self.limiter.remaining)
+
+    @unittest.mock.patch("time.sleep")
+    @unittest.mock.patch("time.time", return_value=1000.0)
+    def test_acquire_waits_until_reset_once_budget_is_spent(self, mock_time, mock_sleep):
+        self.limiter.update_from_headers({'X-RateLimit-Remaining': '100', 'X-RateLimit-Reset': '1100'})
+        self.limiter.acquire(cost=50)
+        self.limiter.acquire(cost=50)
+        self.limiter.acquire(cost=50)
+        self.assertEqual([unittest.mock.call(1.0), unittest.mock.call(100.0)], mock_sleep.call_args_list)
+
+    @unittest.mock.patch("time.sleep")
+    @unittest.mock.patch("time.time", return_value=1000.0)
+    def test_acquire_waits_until_reset_when_cost_exceeds_remaining_points(self, mock_time, mock_sleep):
+        self.limiter.update_from_headers({'X-RateLimit-Remaining': '10', 'X-RateLimit-Reset': '1100'})
+        self.limiter.acquire(cost=20)
+        mock_sleep.assert_called_once_with(100.0)
+
+    def test_update_from_rate_limit_sets_remaining_points_and_reset_time(self):
+        self.limiter.update_from_rate_limit({'cost': 1, 'remaining': 4999, 'resetAt': '2022-01-01T00:00:00Z'})
+        self.assertEqual(4999, self.limiter.remaining)
+        self.assertEqual(1640995200.0, self.limiter.reset_time)
+
+    def test_update_from_headers_ignores_missing_headers(self):
+        self.limiter.update_from_headers({})
+        self.assertIsNone(self.limiter.remaining)
+        self.assertIsNone(self.limiter.reset_time)
+
+
+class TestTokenPool(unittest.TestCase):
+
+    def test_init_requires_a_token(self):
+        with self.assertRaises(ValueError):
+            rateLimiter.TokenPool([])
+
+    @unittest.mock.patch("time.sleep")
+    @unittest.mock.patch("time.time", return_value=1000.0)
+    def test_acquire_picks_token_with_most_remaining_budget(self, mock_time, mock_sleep):
+        pool = rateLimiter.TokenPool(["token-one", "token-two"])
+        pool.update_from_headers("token-one", {'X-RateLimit-Remaining': '10', 'X-RateLimit-Reset': '2000'})
+        pool.update_from_headers("token-two", {'X-RateLimit-Remaining': '3000', 'X-RateLimit-Reset': '2000'})
+
+        self.assertEqual("token-two", pool.acquire())
+
+    @unittest.mock.patch("time.sleep")
+    @unittest.mock.patch("time.time", return_value=1000.0)
+    def test_acquire_uses_tokens_with_unknown_budget_in_turn(self, mock_time, mock_sleep):
+        pool = rateLimiter.TokenPool(["token-one", "token-two"])
+
+        self.assertCountEqual(["token-one", "token-two"], [pool.acquire(), pool.acquire()])
+        mock_sleep.assert_not_called()
+
+    @unittest.mock.patch("time.sleep")
+    @unittest.mock.patch("time.time", return_value=1000.0)
+    def test_tokens_track_reset_time_separately(self, mock_time, mock_sleep):
+        pool = rateLimiter.TokenPool(["token-one", "token-two"])
+        pool.update_from_rate_limit("token-one", {'remaining': 0, 'resetAt': '2022-01-01T00:00:00Z'})
+
+        self.assertEqual(0, pool.rate_limiters["token-one"].remaining)
+        self.assertIsNone(pool.rate_limiters["token-two"].remaining)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+# Copyright 2021 VMware, Inc.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import tempfile
+import time
+import unittest
+
+from mcat import responseCache
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.query = {"query": "test-query", "variables": {"owner": "test-org", "cursor": "test-cursor"}}
+        self.response_json = {
+            "data": {
+                "repository": {"name": "test-repo"},
+                "rateLimit": {"cost": 1, "remaining": 4999, "resetAt": "2022-01-01T00:00:00Z"}
+            }
+        }
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_init_rejects_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            responseCache.ResponseCache(self.directory.name, mode="test-mode")
+
+    def test_get_returns_none_for_missing_response_in_record_mode(self):
+        cache = responseCache.ResponseCache(self.directory.name)
+        self.assertIsNone(cache.get(self.query))
+
+    def test_get_raises_for_missing_response_in_replay_mode(self):
+        cache = responseCache.ResponseCache(self.directory.name, mode=responseCache.REPLAY)
+        with self.assertRaises(responseCache.CacheMissError):
+            cache.get(self.query)
+
+    def test_put_and_get_round_trip_without_rate_limit(self):
+        cache = responseCache.ResponseCache(self.directory.name)
+        cache.put(self.query, self.response_json)
+
+        self.assertEqual({"data": {"repository": {"name": "test-repo"}}}, cache.get(self.query))
+
+    def test_key_ignores_page_size_and_variable_order(self):
+        cache = responseCache.ResponseCache(self.directory.name)
+        query = {"query": "test-query", "variables": {"cursor": "test-cursor", "owner": "test-org", "pageSize": 25}}
+
+        self.assertEqual(cache.key(self.query), cache.key(query))
+        self.assertNotEqual(cache.key(self.query), cache.key({"query": "test-query", "variables": {}}))
+
+    def test_get_ignores_expired_response(self):
+        cache = responseCache.ResponseCache(self.directory.name, ttl=60)
+        cache.put(self.query, self.response_json)
+
+        expired = time.time() - 120
+        os.utime(cache.path(cache.key(self.query)), (expired, expired))
+        self.assertIsNone(cache.get(self.query))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+# Copyright 2021 VMware, Inc.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+import pandas as pd
+
+from mcat import utils
+
+
+class TestUtils(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.exports_dir_patch = unittest.mock.patch("mcat.utils.EXPORTS_DIR", self.directory.name)
+        self.exports_dir_patch.start()
+        self.comments = [{"Created_At": "2022-01-01T00:00:00Z", "User": "test-user", "Body": "test 'body'"}]
+
+    def tearDown(self):
+        self.exports_dir_patch.stop()
+        self.directory.cleanup()
+
+    def test_export_data_frame_jsonl_round_trip_keeps_nested_comments(self):
+        export_df = pd.DataFrame({"Number": [1, 2], "Comments": [self.comments, []],
+                                  "Review_Comments": [[], self.comments], "Merged_At": [None, float("nan")]})
+
+        utils.export_data_frame(export_df, "test.jsonl")
+        actual = utils.read_raw_data(os.path.join(self.directory.name, "test.jsonl"))
+
+        self.assertEqual([1, 2], list(actual["Number"]))
+        self.assertEqual([self.comments, []], list(actual["Comments"]))
+        self.assertEqual([[], self.comments], list(actual["Review_Comments"]))
+        self.assertTrue(actual["Merged_At"].isna().all())
+
+    def test_read_raw_data_converts_legacy_csv(self):
+        export_df = pd.DataFrame({"Number": [1], "Comments": [self.comments], "Review_Comments": [[]]})
+
+        utils.export_data_frame(export_df, "test.csv")
+        actual = utils.read_raw_data(os.path.join(self.directory.name, "test.csv"))
+
+        self.assertEqual([self.comments], list(actual["Comments"]))
+        self.assertEqual([[]], list(actual["Review_Comments"]))
+
+    def test_string_to_dict_list_converts_nested_strings(self):
+        string = str([str(comment) for comment in self.comments])
+        self.assertEqual(self.comments, utils.string_to_dict_list(string))
+
+    def test_decode_string_parses_json_and_python_literals(self):
+        self.assertEqual([], utils.decode_string("[]"))
+        self.assertEqual([{"User": None, "Body": "test"}], utils.decode_string('[{"User": null, "Body": "test"}]'))
+        self.assertEqual(self.comments, utils.decode_string(str(self.comments)))
+
+    def test_decode_comment_columns_in_chunks_across_processes(self):
+        data = pd.DataFrame({"Comments": [str(self.comments), "[]", str(self.comments)],
+                             "Review_Comments": ["[]", str(self.comments), "[]"]}, index=[5, 6, 7])
+
+        utils.decode_comment_columns(data, workers=2, chunk_size=2)
+
+        self.assertEqual([self.comments, [], self.comments], list(data["Comments"]))
+        self.assertEqual([[], self.comments, []], list(data["Review_Comments"]))
+        self.assertEqual([5, 6, 7], list(data.index))
+
+    def test_decode_comment_columns_nested(self):
+        nested = str([str(comment) for comment in self.comments])
+        data = pd.DataFrame({"Comments": [nested], "Review_Comments": ["[]"]})
+
+        utils.decode_comment_columns(data, nested=True, workers=1)
+        self.assertEqual([self.comments], list(data["Comments"]))
+        self.assertEqual([[]], list(data["Review_Comments"]))
+
+    def test_read_raw_data_chunks_of_csv_and_jsonl_exports(self):
+        export_df = pd.DataFrame({"Number": [1, 2, 3], "Comments": [self.comments, [], []],
+                                  "Review_Comments": [[], [], self.comments]})
+        for name in ["test.csv", "test.jsonl"]:
+            utils.export_data_frame(export_df, name)
+
+            chunks = list(utils.read_raw_data_chunks(os.path.join(self.directory.name, name), 2, workers=1))
+            self.assertEqual([2, 1], [len(chunk) for chunk in chunks])
+            self.assertEqual([[1, 2], [3]], [list(chunk["Number"]) for chunk in chunks])
+            self.assertEqual([self.comments, []], list(chunks[0]["Comments"]))
+            self.assertEqual([self.comments], list(chunks[1]["Review_Comments"]))
+
+    def test_export_chunks_to_cvs_writes_one_header(self):
+        chunks = [pd.DataFrame({"Number": [1, 2], "Thread": ["one", "two"]}),
+                  pd.DataFrame({"Number": [3], "Thread": ["three"]})]
+
+        count = utils.export_chunks_to_cvs(iter(chunks), "test.csv")
+
+        self.assertEqual(3, count)
+        actual = pd.read_csv(os.path.join(self.directory.name, "test.csv"))
+        self.assertEqual([1, 2, 3], list(actual["Number"]))
+        self.assertEqual(["one", "two", "three"], list(actual["Thread"]))
+
+    def test_merge_with_export_reads_jsonl_export(self):
+        utils.export_data_frame(pd.DataFrame({"Number": [1, 2], "Title": ["one", "two"]}), "test.jsonl")
+        update_df = pd.DataFrame({"Number": [2, 3], "Title": ["two updated", "three"]})
+
+        actual = utils.merge_with_export(update_df, "test.jsonl")
+        self.assertEqual([1, 2, 3], list(actual["Number"]))
+        self.assertEqual(["one", "two updated", "three"], list(actual["Title"]))
+
+
+if __name__ == '__main__':
+    unittest.main()